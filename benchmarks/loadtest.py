@@ -0,0 +1,115 @@
+"""
+A small load test for the running app. It hammers each url with
+concurrent GET requests for a fixed amount of time and prints the
+requests per second it saw along with the mean and 95th percentile
+latency.
+
+Start the server first, either the dev server (python run.py) or the
+production one (gunicorn -c gunicorn_config.py wsgi:application),
+then run:
+
+    python benchmarks/loadtest.py --base-url http://127.0.0.1:8000
+
+Only the standard library is used so this runs in any environment.
+"""
+import argparse
+import concurrent.futures as futures
+import threading
+import time
+import urllib.request
+
+DEFAULT_PATHS = ['/', '/show_data', '/show_data?page=100']
+
+
+def fetch(url, timeout=60):
+    """
+    GET a url and read the whole response body.
+    :param url: the full url string
+    :param timeout: seconds to wait for the server
+    :return: a tuple of the http status code and the request latency in seconds
+    """
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        response.read()
+        status = response.status
+    return status, time.perf_counter() - start
+
+
+def run_load(url, concurrency, duration):
+    """
+    Keep `concurrency` clients requesting the url until `duration`
+    seconds have passed.
+    :param url: the full url string
+    :param concurrency: an integer number of simultaneous clients
+    :param duration: how many seconds to run for
+    :return: a dict of results for the url
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < deadline:
+            try:
+                status, latency = fetch(url)
+            except Exception as exc:
+                with lock:
+                    errors.append(exc)
+                continue
+            with lock:
+                if status == 200:
+                    latencies.append(latency)
+                else:
+                    errors.append(status)
+
+    start = time.perf_counter()
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    count = len(latencies)
+    return {'url': url,
+            'requests': count,
+            'errors': len(errors),
+            'requests_per_sec': count / elapsed,
+            'mean_ms': 1000 * sum(latencies) / count if count else float('nan'),
+            'p95_ms': 1000 * latencies[int(0.95 * (count - 1))] if count else float('nan')}
+
+
+def print_results(results):
+    """
+    Print a table of the load test results.
+    :param results: a list of dicts from run_load
+    :return: None
+    """
+    header = '{:<40} {:>9} {:>7} {:>10} {:>10} {:>10}'
+    row = '{url:<40} {requests:>9} {errors:>7} {requests_per_sec:>10.1f} {mean_ms:>10.1f} {p95_ms:>10.1f}'
+    print(header.format('url', 'requests', 'errors', 'req/s', 'mean ms', 'p95 ms'))
+    for result in results:
+        print(row.format(**result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='seconds to load each url for')
+    parser.add_argument('paths', nargs='*', default=DEFAULT_PATHS)
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/')
+    # One request per url first so lazy setup isn't counted.
+    for path in args.paths:
+        fetch(base_url + path)
+
+    results = [run_load(base_url + path, args.concurrency, args.duration)
+               for path in args.paths]
+    print_results(results)
+
+
+if __name__ == '__main__':
+    main()
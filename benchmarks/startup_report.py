@@ -0,0 +1,94 @@
+"""
+Reports where the time goes when the app starts. It runs a fresh
+interpreter with python -X importtime to import the rti_app package and
+prints the slowest imports by cumulative time, then times loading the
+census data with core.get_data_processor separately.
+
+    python benchmarks/startup_report.py
+
+Needs python 3.7 or newer for -X importtime.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOAD_DATA_SCRIPT = """
+import time
+start = time.perf_counter()
+import rti_app.core as core
+imported = time.perf_counter()
+core.get_data_processor()
+loaded = time.perf_counter()
+print(imported - start, loaded - imported)
+"""
+
+
+def import_times(module):
+    """
+    Import a module in a new interpreter with -X importtime.
+    :param module: the module name to import
+    :return: a list of (cumulative microseconds, self microseconds, module name)
+     tuples, one per imported module.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                            cwd=PACKAGE_DIR, stderr=subprocess.PIPE, universal_newlines=True,
+                            check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return times
+
+
+def top_level_imports(times):
+    """
+    Keep only the imports that weren't made by another import, so their
+    cumulative times add up to the total.
+    :param times: a list from import_times
+    :return: a list of the same tuples
+    """
+    indent = min(len(name) - len(name.lstrip()) for _, _, name in times)
+    return [time for time in times if len(time[2]) - len(time[2].lstrip()) == indent]
+
+
+def data_load_times():
+    """
+    Time importing rti_app.core and loading the census data in a new interpreter.
+    :return: a tuple of the import and load times in seconds
+    """
+    result = subprocess.run([sys.executable, '-c', LOAD_DATA_SCRIPT], cwd=PACKAGE_DIR,
+                            stdout=subprocess.PIPE, universal_newlines=True, check=True)
+    imported, loaded = result.stdout.split()
+    return float(imported), float(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--module', default='rti_app')
+    parser.add_argument('--top', type=int, default=15,
+                        help='how many of the slowest imports to show')
+    args = parser.parse_args()
+
+    times = import_times(args.module)
+    total_us = sum(cumulative for cumulative, _, _ in top_level_imports(times))
+    print('import {}: {:.1f} ms'.format(args.module, total_us / 1000))
+    print('{:>12} {:>12}  {}'.format('cumulative', 'self', 'module'))
+    for cumulative, self_us, name in sorted(times, reverse=True)[:args.top]:
+        print('{:>9.1f} ms {:>9.1f} ms  {}'.format(cumulative / 1000, self_us / 1000, name.strip()))
+
+    for heavy in ('plotly', 'sqlalchemy', 'pandas'):
+        loaded = any(name.strip() == heavy for _, _, name in times)
+        print('{} imported: {}'.format(heavy, 'yes' if loaded else 'no'))
+
+    imported, loaded = data_load_times()
+    print('import rti_app.core: {:.1f} ms, load data on first use: {:.1f} ms'.format(
+        imported * 1000, loaded * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+gunicorn settings for serving wsgi.py in production.
+
+Worker and thread counts come from rti_app/config.py which reads the
+RTI_WORKERS, RTI_THREADS and RTI_BIND environment variables. The config
+module is loaded straight from its file so reading these settings doesn't
+import the app (and load the data) before gunicorn is ready to preload it.
+"""
+import importlib.util
+import os
+
+os.environ.setdefault('RTI_ENV', 'production')
+
+
+def load_app_config():
+    """
+    Load rti_app/config.py as a standalone module.
+    :return: the config module
+    """
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'rti_app', 'config.py')
+    spec = importlib.util.spec_from_file_location('rti_app_config', config_path)
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    return config
+
+
+app_config = load_app_config()
+
+bind = app_config.BIND
+workers = app_config.WORKERS
+threads = app_config.THREADS_PER_WORKER
+worker_class = 'gthread'
+
+# Load the app, and with it the census data, in the master before forking.
+preload_app = True
+reload = False
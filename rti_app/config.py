@@ -1,18 +1,63 @@
 """
 This file taken from https://github.com/icecreammatt/flask-empty
 and modified for this project.
+
+Setting the RTI_ENV environment variable to 'production' turns off
+the debug and testing flags. The wsgi.py entry point does this for us.
 """
 
 import os
 _basedir = os.path.abspath(os.path.dirname(__file__))
 
-DEBUG = True
-TESTING = True
+PRODUCTION = os.environ.get('RTI_ENV', 'development') == 'production'
+
+DEBUG = not PRODUCTION
+TESTING = not PRODUCTION
 
 ADMINS = frozenset(['scott.dillon@gmail.com'])
 SECRET_KEY = 'WillWorkForJob'
 
-THREADS_PER_PAGE = 8
+# How many rows of the census data to show on each page of /show_data
+RECORDS_PER_PAGE = 25
+
+# How many records /export reads and writes at a time
+EXPORT_CHUNK_SIZE = 5000
+
+# How many /api/aggregate query results each data processor caches
+QUERY_CACHE_SIZE = 256
+
+# The combinations of dimension columns to precompute a data cube over.
+# Group by queries over a subset of one of these come straight from the cube.
+# The single column ones give the value counts the dashboard summary is
+# computed from. A cuboid's size is the product of its columns' distinct
+# value counts, so continuous columns only belong on their own. Cuboids
+# bigger than CensusCube.MAX_CELLS are refused.
+CUBE_DIMENSIONS = [('Over 50K', 'Married', 'Race', 'Sex'),
+                   ('Age', 'Over 50K', 'Sex'),
+                   ('Education Level', 'Work Class', 'Over 50K'),
+                   ('Marital Status', 'Relationship Name', 'Sex'),
+                   ('Hours Per Week',),
+                   ('Education Num',),
+                   ('Income',),
+                   ('Loss',)]
+
+# Set RTI_CHUNK_SIZE to read the census data this many records at a time
+# instead of loading it all into memory. For data sets bigger than RAM.
+DATA_CHUNK_SIZE = int(os.environ.get('RTI_CHUNK_SIZE', 0)) or None
+
+# Where the chunks are read from: 'csv' for the flattened csv file, which is
+# written first if it's missing, or 'sqlite' to fetch them from a cursor on
+# the database with the flattening query. Set with RTI_CHUNK_SOURCE.
+CHUNK_SOURCE = os.environ.get('RTI_CHUNK_SOURCE', 'csv')
+
+# Set RTI_PROCESSES to compute the dashboard aggregates of the in-memory
+# census data with this many processes, one partition of the rows each.
+AGGREGATE_PROCESSES = int(os.environ.get('RTI_PROCESSES', 0)) or None
+
+# Process and thread counts for the preforking server. See gunicorn_config.py
+WORKERS = int(os.environ.get('RTI_WORKERS', (os.cpu_count() or 1) * 2 + 1))
+THREADS_PER_WORKER = int(os.environ.get('RTI_THREADS', 4))
+BIND = os.environ.get('RTI_BIND', '127.0.0.1:8000')
 
 CSRF_ENABLED = True
 CSRF_SESSION_KEY = "supercalifragilistic98765"
@@ -1,4 +1,6 @@
 import os.path as path
+import threading
+from . import config
 from .resource import exercise_libs as el
 
 """
@@ -14,37 +16,84 @@ sqlite_file = el.get_full_path(SQLITE_FILE)
 query_file = el.get_full_path(QUERY_FILE)
 csv_file = el.get_full_path(CSV_FILE)
 
+# The DataProcessor for use in views.py. It's created by get_data_processor
+# on first use, not when this module is imported.
+_data_processor = None
+_data_processor_lock = threading.Lock()
+
 
 def write_csv_file():
     """
     Open the database, query it and write the csv file.
     This writes into the resource directory instead of the
-    current path.
+    current path. In chunked mode the query results are written a
+    chunk at a time so they're never all in memory.
     :return:
     """
     el.write_csv_file(sqlite_file=sqlite_file,
                       query_file=query_file,
-                      csv_file=csv_file)
+                      csv_file=csv_file,
+                      chunk_size=config.DATA_CHUNK_SIZE)
 
 
 def load_csv_data():
     """
     Now, load the csv file into a dataframe for
     processing, etc.
+
+    If a data chunk size is configured, the csv file, or the database
+    if that's the configured chunk source, is read a chunk at a time when
+    needed instead. If a number of aggregate processes is configured, the
+    dashboard is computed in parallel.
     :return:
-    """
+    :raises ValueError: for an unknown chunk source.
+    """
+    if config.DATA_CHUNK_SIZE:
+        if config.CHUNK_SOURCE == 'sqlite':
+            return el.ChunkedDataProcessor.from_sql(sqlite_file, query_file, config.DATA_CHUNK_SIZE,
+                                                    query_cache_size=config.QUERY_CACHE_SIZE)
+        if config.CHUNK_SOURCE != 'csv':
+            raise ValueError('Unknown chunk source {!r}'.format(config.CHUNK_SOURCE))
+        return el.ChunkedDataProcessor.from_csv(csv_file, config.DATA_CHUNK_SIZE,
+                                                query_cache_size=config.QUERY_CACHE_SIZE)
     csv = el.CSVLoader(csv_file).dataframe
-    data_proc = el.DataProcessor(csv)
+    if config.AGGREGATE_PROCESSES:
+        data_proc = el.PartitionedDataProcessor(csv, processes=config.AGGREGATE_PROCESSES,
+                                                query_cache_size=config.QUERY_CACHE_SIZE,
+                                                cube_dimensions=config.CUBE_DIMENSIONS)
+    else:
+        data_proc = el.DataProcessor(csv, query_cache_size=config.QUERY_CACHE_SIZE,
+                                     cube_dimensions=config.CUBE_DIMENSIONS)
     data_proc.create_married_column()
     return data_proc
 
 
+def get_data_processor():
+    """
+    Return the DataProcessor for the census data, writing the csv file
+    and loading the data the first time it's called. Later calls, from
+    any thread, get the same object.
+    :return: a DataProcessor (or chunked/partitioned) object
+    """
+    global _data_processor
+    if _data_processor is None:
+        with _data_processor_lock:
+            if _data_processor is None:
+                reads_database = config.DATA_CHUNK_SIZE and config.CHUNK_SOURCE == 'sqlite'
+                if not reads_database and not path.isfile(csv_file):
+                    # If our csv file doesn't already exist, go ahead and create it.
+                    write_csv_file()
+                _data_processor = load_csv_data()
+    return _data_processor
+
+
 def get_index_text():
     """
     Perform some grouping on the data and return table html from
     dataframes.
     :return: a tuple of html strings which are tables.
     """
+    data_processor = get_data_processor()
     aggregate_funcs = {'Married': ['count'],
                        'Age': ['mean'],
                        'Hours Per Week': ['mean'],
@@ -52,8 +101,7 @@ def get_index_text():
 
     summary = data_processor.describe_census_data()
     summary_html = el.change_table_css_class(summary)
-    gb_over_50k_race = data_processor.groupby_50k_married_race()
-    df_over_50k = data_processor.aggregate_groupby(gb_over_50k_race, aggregate_funcs)
+    df_over_50k = data_processor.aggregate_50k_married_race(aggregate_funcs)
     html_over_50k = el.change_table_css_class(df_over_50k)
     return summary_html, html_over_50k
 
@@ -69,12 +117,15 @@ def hours_worked_plot():
     removed.
     :return:
     """
+    from .resource import plots
+
+    data_processor = get_data_processor()
     quantile_hours_worked = data_processor.get_quantile_traces()
     mean_hours_worked = data_processor.get_mean_trace()
     quantile_hours_worked.append(mean_hours_worked)
-    layout = el.HoursWorkedLayout()
-    fig = el.PlotlyFigure(data=quantile_hours_worked, layout=layout)
-    div = el.get_plotly_div_str(figure_obj=fig)
+    layout = plots.HoursWorkedLayout()
+    fig = plots.PlotlyFigure(data=quantile_hours_worked, layout=layout)
+    div = plots.get_plotly_div_str(figure_obj=fig)
     return div
 
 
@@ -84,49 +135,114 @@ def histogram_hours_worked():
     create histogram plots of hours worked.
     :return:
     """
-    over_50kdf, under_50k_df = data_processor.get_histo_hours_worked_data()
-    histo_traces = el.get_histo_hours_worked_traces(over_50kdf, under_50k_df)
-    layout = el.HistogramLayout()
-    figure = el.PlotlyFigure(data=histo_traces, layout=layout)
-    div = el.get_plotly_div_str(figure_obj=figure)
+    from .resource import plots
+
+    data_processor = get_data_processor()
+    histo_traces = data_processor.get_histo_hours_worked_traces()
+    layout = plots.HistogramLayout()
+    figure = plots.PlotlyFigure(data=histo_traces, layout=layout)
+    div = plots.get_plotly_div_str(figure_obj=figure)
     return div
 
 
 def over_50k_country_origin():
     """
-    Gets dataframes of over and under 50k records, creates the
+    Gets counts of over 50k records by country, creates the
     map plot and returns the div string to insert into the
     template file.
     :return: div: a string of html
     """
+    from .resource import plots
+
+    data_processor = get_data_processor()
     origins_dataframe = data_processor.get_country_data()
-    choropleth_obj = el.ChoroplethOrigins(z=origins_dataframe)
-    choro_layout = el.ChoroLayout()
-    figure = el.PlotlyFigure(data=[choropleth_obj],
+    choropleth_obj = plots.ChoroplethOrigins(z=origins_dataframe)
+    choro_layout = plots.ChoroLayout()
+    figure = plots.PlotlyFigure(data=[choropleth_obj],
                              layout=choro_layout)
-    div = el.get_plotly_div_str(figure_obj=figure)
+    div = plots.get_plotly_div_str(figure_obj=figure)
     return div
 
 
-def chop_dataframe(data_proc, records_per_page):
+def parse_aggregations(agg_args):
     """
-    Checks to see if the data processor object already has
-    chopped up the census data dataframe. If not, do so.
-    :param data_proc: a DataProcessor object from exercise_libs.py
-    :param records_per_page: an integer noting how many records we want to
-        see per page of the pagination.
-    :return:
+    Turn aggregation query string values like 'Age:mean,max' into
+    an aggregation dict.
+    :param agg_args: a list of 'column:function,function' strings
+    :return: a dict of column names to lists of function names.
+    :raises ValueError: if a value isn't in that form.
     """
-    if data_proc.list_pages is None:
-        data_proc.paginate_dataframe(records_per_page)
+    agg_dict = {}
+    for agg_arg in agg_args:
+        col, funcs = agg_arg.split(':')
+        agg_dict.setdefault(col, []).extend(func.strip() for func in funcs.split(','))
+    return agg_dict
 
 
-if not path.isfile(CSV_FILE):
+def aggregate_json(groupby_cols, agg_dict, filters=None):
     """
-    If our csv file doesn't already exist, go ahead and create it.
+    Run a group by query and return the groups as json records. The
+    aggregate columns are named like 'Age mean'.
+    :param groupby_cols: a list of column names to group by
+    :param agg_dict: a dict of column names to lists of function names.
+    :param filters: an optional dict of column names to lists of values
+        to restrict the records to. See DataProcessor.filter_positions
+    :return: a json string of a list of objects, one per group.
+    :raises KeyError: for an unknown column.
+    :raises ValueError: for a bad query.
     """
-    write_csv_file()
+    data_processor = get_data_processor()
+    result = data_processor.query_aggregate(groupby_cols, agg_dict, filters=filters)
+    records = result.copy()
+    records.columns = [' '.join(col) for col in result.columns]
+    return records.reset_index().to_json(orient='records')
 
-# Instantiate a DataProcessor object for use in views.py
-data_processor = load_csv_data()
 
+def warm_up(records_per_page):
+    """
+    Do the data processor's one-off work now rather than on the first
+    request: paginate the data and compute any partial aggregates,
+    data cube and country index.
+    :param records_per_page: an integer noting how many records we want to
+        see per page of the pagination.
+    :return:
+    """
+    data_processor = get_data_processor()
+    data_processor.page_count(records_per_page)
+    if isinstance(data_processor, el.PartialsDashboard):
+        data_processor.partials
+    if isinstance(data_processor, el.DataProcessor):
+        data_processor.cube
+        data_processor.country_index
+
+
+def export_records(filters, export_format, chunk_size, page=None, page_length=None):
+    """
+    Set up a streaming export of the census records matching the filters.
+    The filters are checked and the matching rows found right away so bad
+    parameters are raised here. The records themselves are only read a
+    chunk at a time as the returned generator is consumed.
+    :param filters: a dict of column names to lists of values to match.
+        See DataProcessor.filter_positions
+    :param export_format: one of the keys of exercise_libs.EXPORT_FORMATS
+    :param chunk_size: an integer number of records to read per chunk
+    :param page: an optional page number of the paginated data view to
+        restrict the export to. It's clamped to the pages there are, the
+        same as the view does.
+    :param page_length: an integer for how many records are on a page.
+    :return: a tuple of the generator of response chunks, the mimetype
+        and a file name for the download.
+    :raises KeyError: for an unknown format or filter column.
+    :raises ValueError: for a filter value of the wrong type.
+    :raises ImportError: if the format's optional dependency is missing.
+    """
+    data_processor = get_data_processor()
+    to_chunks, mimetype, extension = el.EXPORT_FORMATS[export_format]
+    rows = None
+    if page is not None:
+        page = sorted([1, page, data_processor.page_count(page_length)])[1]
+        rows = data_processor.page_rows(page, page_length)
+    frames = data_processor.iter_filtered_records(filters, chunk_size, rows=rows)
+    content = to_chunks(frames)
+    file_name = 'census_records.{}'.format(extension)
+    return content, mimetype, file_name
@@ -0,0 +1,15 @@
+"""
+Author: Scott Dillon
+Email: scott.dillon@gmail.com
+
+The names of the census data columns the data processing modules refer to.
+"""
+AGE = 'Age'
+HOURS_PER_WEEK = 'Hours Per Week'
+EDUCATION_NUM = 'Education Num'
+INCOME = 'Income'
+LOSS = 'Loss'
+OVER_50K = 'Over 50K'
+MARRIED = 'Married'
+RACE = 'Race'
+COUNTRY = 'Country'
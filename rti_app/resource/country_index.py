@@ -0,0 +1,107 @@
+"""
+Author: Scott Dillon
+Email: scott.dillon@gmail.com
+
+An index of the census records by country, so the per-country numbers for
+the dashboard map are read off precomputed arrays.
+"""
+import numpy as np
+import pandas as pd
+
+from .columns import HOURS_PER_WEEK, OVER_50K, COUNTRY
+
+
+class CountryIndex(object):
+    """
+    An index of the census records by country, built once per data version
+    from the country category codes. It keeps the row positions of each
+    country's records and per-country record counts, over 50k counts and
+    hours worked sums, so per-country figures are read from arrays with
+    one entry per country rather than by filtering and grouping the records.
+    """
+    def __init__(self, countries, positions, offsets, counts, over_50k_counts, hours_sums):
+        """
+        :param countries: an index of the country names, in code order
+        :param positions: the row positions of every record, sorted by country code
+        :param offsets: where each country's rows start in positions, plus
+         the end of the last country's.
+        :param counts: an array of record counts per country
+        :param over_50k_counts: an array of over 50k record counts per country
+        :param hours_sums: an array of total hours per week per country
+        """
+        self.countries = countries
+        self.positions = positions
+        self.offsets = offsets
+        self.counts = counts
+        self.over_50k_counts_array = over_50k_counts
+        self.hours_sums = hours_sums
+
+    @classmethod
+    def from_processor(cls, data_proc):
+        """
+        Build the index from a DataProcessor's country codes.
+        :param data_proc: a DataProcessor obj
+        :return: a CountryIndex obj
+        """
+        codes, countries = data_proc.category_codes(COUNTRY)
+        has_country = codes >= 0
+        country_codes = codes[has_country]
+        census_data = data_proc.census_data
+
+        # A stable sort keeps each country's rows in their original order.
+        # Rows with no country have code -1 and sort to the front.
+        positions = np.argsort(codes, kind='mergesort')[np.count_nonzero(~has_country):]
+        counts = np.bincount(country_codes, minlength=len(countries))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        over_50k = census_data[OVER_50K].values[has_country] == 1
+        hours = census_data[HOURS_PER_WEEK].values[has_country].astype(float)
+        over_50k_counts = np.bincount(country_codes[over_50k], minlength=len(countries))
+        hours_sums = np.bincount(country_codes, weights=hours, minlength=len(countries))
+        return cls(countries, positions, offsets, counts, over_50k_counts, hours_sums)
+
+    def rows(self, country):
+        """
+        The row positions of a country's records, for drilling down into them
+        with census_data.iloc.
+        :param country: a country name
+        :return: a numpy array of row positions. Empty for an unknown country.
+        """
+        code = self.countries.get_indexer([country])[0]
+        if code < 0:
+            return self.positions[:0]
+        return self.positions[self.offsets[code]:self.offsets[code + 1]]
+
+    def over_50k_counts(self, exclude=('United-States', '?')):
+        """
+        Count where records are from who make more than 50k.
+        :param exclude: countries to leave out
+        :return: a series of counts indexed by country
+        """
+        keep = (self.over_50k_counts_array > 0) & ~self.countries.isin(exclude)
+        index = pd.Index(self.countries[keep], name=COUNTRY)
+        return pd.Series(self.over_50k_counts_array[keep], index=index, name=COUNTRY)
+
+    def income_mix(self):
+        """
+        The number of records over and under 50k from each country and
+        the share that are over 50k.
+        :return: a dataframe indexed by country
+        """
+        has_records = self.counts > 0
+        counts = self.counts[has_records]
+        over_50k = self.over_50k_counts_array[has_records]
+        return pd.DataFrame({'Over 50K': over_50k,
+                             'Under 50K': counts - over_50k,
+                             'Over 50K Share': over_50k / counts},
+                            index=pd.Index(self.countries[has_records], name=COUNTRY),
+                            columns=['Over 50K', 'Under 50K', 'Over 50K Share'])
+
+    def mean_hours(self):
+        """
+        The mean hours worked per week of the records from each country.
+        :return: a series indexed by country
+        """
+        has_records = self.counts > 0
+        return pd.Series(self.hours_sums[has_records] / self.counts[has_records],
+                         index=pd.Index(self.countries[has_records], name=COUNTRY),
+                         name=HOURS_PER_WEEK)
@@ -0,0 +1,271 @@
+"""
+Author: Scott Dillon
+Email: scott.dillon@gmail.com
+
+A data cube of the census measures over low cardinality dimensions, so
+group by queries over them are a roll up of a small array rather than a
+scan of the records.
+"""
+import collections
+import numpy as np
+import pandas as pd
+
+from .columns import AGE, HOURS_PER_WEEK, EDUCATION_NUM, INCOME, LOSS
+from .query import fix_column_name, finish_group_stats
+from .partials import describe_value_counts
+
+
+class Cuboid(object):
+    """
+    Count, sum, sum of squares, min and max of the cube measures for every
+    combination of values of a few dimension columns. Each is a dense numpy
+    array with an axis per dimension, indexed by the dimension's category
+    codes, so rolling up or slicing is a numpy reduction over a small array
+    rather than a scan of the records.
+    """
+    STATS = ('sum', 'sumsq', 'min', 'max')
+
+    def __init__(self, dims, categories, count, measures):
+        """
+        :param dims: a tuple of dimension column names, one per axis.
+        :param categories: a list of indexes of the values along each axis.
+        :param count: an array of record counts per cell
+        :param measures: a dict of measure column name to a dict of stat
+         name to an array of that stat per cell.
+        """
+        self.dims = tuple(dims)
+        self.categories = categories
+        self.count = count
+        self.measures = measures
+
+    @classmethod
+    def from_processor(cls, data_proc, dims, measures, max_cells=None):
+        """
+        Build a cuboid from a DataProcessor's census data and category codes
+        with a single pass of bincounts.
+        :param data_proc: a DataProcessor obj
+        :param dims: a tuple of dimension column names
+        :param measures: a list of numeric column names
+        :param max_cells: an optional cap on the number of cells.
+        :return: a Cuboid obj
+        :raises ValueError: if the dimensions have more combinations than the cap.
+        """
+        codes = [data_proc.category_codes(dim) for dim in dims]
+        categories = [uniques for _, uniques in codes]
+        shape = tuple(len(uniques) for uniques in categories)
+        size = int(np.prod(shape))
+        if max_cells is not None and size > max_cells:
+            raise ValueError('A cuboid over {} would have {} cells, more than the {} allowed'.format(
+                list(dims), size, max_cells))
+        has_cell = np.ones(len(data_proc.census_data), dtype=bool)
+        for dim_codes, _ in codes:
+            has_cell &= dim_codes >= 0
+        cells = np.ravel_multi_index([dim_codes[has_cell] for dim_codes, _ in codes], shape)
+
+        count = np.bincount(cells, minlength=size).reshape(shape)
+        arrays = {}
+        for measure in measures:
+            values = data_proc.census_data[measure].values[has_cell].astype(float)
+            minimum = np.full(size, np.inf)
+            maximum = np.full(size, -np.inf)
+            np.minimum.at(minimum, cells, values)
+            np.maximum.at(maximum, cells, values)
+            arrays[measure] = {'sum': np.bincount(cells, weights=values, minlength=size).reshape(shape),
+                               'sumsq': np.bincount(cells, weights=values ** 2, minlength=size).reshape(shape),
+                               'min': minimum.reshape(shape),
+                               'max': maximum.reshape(shape)}
+        return cls(dims, categories, count, arrays)
+
+    @property
+    def size(self):
+        """
+        The number of cells.
+        :return: an integer
+        """
+        return self.count.size
+
+    def rollup(self, dims, where=None, measures=None):
+        """
+        Slice the cuboid to the given values of some dimensions and roll it
+        up to fewer dimensions.
+        :param dims: the dimension column names to keep, in the order the
+         axes of the result should be in. Must be dimensions of this cuboid.
+        :param where: an optional dict of dimension column names to lists of
+         values to keep.
+        :param measures: the measures to keep. Defaults to all of them.
+        :return: a new Cuboid obj
+        """
+        where = where or {}
+        count = self.count
+        measures = {measure: dict(self.measures[measure])
+                    for measure in (self.measures if measures is None else measures)}
+        categories = list(self.categories)
+        for axis, dim in enumerate(self.dims):
+            if dim in where:
+                positions = categories[axis].get_indexer(where[dim])
+                positions = positions[positions >= 0]
+                categories[axis] = categories[axis].take(positions)
+                count = count.take(positions, axis=axis)
+                for arrays in measures.values():
+                    for stat in self.STATS:
+                        arrays[stat] = arrays[stat].take(positions, axis=axis)
+
+        rolled_axes = tuple(axis for axis, dim in enumerate(self.dims) if dim not in dims)
+        kept = [dim for dim in self.dims if dim in dims]
+        order = [kept.index(dim) for dim in dims]
+        # The reducer and empty cell value of each stat.
+        reducers = {'sum': (np.sum, 0.), 'sumsq': (np.sum, 0.),
+                    'min': (np.min, np.inf), 'max': (np.max, -np.inf)}
+
+        count = np.sum(count, axis=rolled_axes).transpose(order)
+        for arrays in measures.values():
+            for stat in self.STATS:
+                reducer, empty = reducers[stat]
+                if arrays[stat].size:
+                    arrays[stat] = reducer(arrays[stat], axis=rolled_axes).transpose(order)
+                else:
+                    # A where that keeps nothing. np.min and np.max can't
+                    # reduce an empty array, so fill in the empty cell value.
+                    arrays[stat] = np.full(count.shape, empty)
+        categories = [categories[self.dims.index(dim)] for dim in dims]
+        return Cuboid(dims, categories, count, measures)
+
+    def to_stats(self, count_columns=()):
+        """
+        Turn the non-empty cells into a dataframe of group stats, the same
+        as group_stats makes, for finish_group_stats.
+        :param count_columns: any other columns to add a count for. With no
+         missing values their count is the record count.
+        :return: a dataframe indexed by the dimension values
+        """
+        index = pd.MultiIndex.from_product(self.categories, names=list(self.dims))
+        count = self.count.ravel()
+        has_records = count > 0
+        stats = {}
+        for col in count_columns:
+            stats[(col, 'count')] = count[has_records]
+        for measure, arrays in self.measures.items():
+            stats[(measure, 'count')] = count[has_records]
+            for stat in self.STATS:
+                stats[(measure, stat)] = arrays[stat].ravel()[has_records]
+        index = index[has_records]
+        if len(self.dims) == 1:
+            index = index.get_level_values(0)
+        return pd.DataFrame(stats, index=index)
+
+
+class CensusCube(object):
+    """
+    A data cube of the census measures over the low cardinality census
+    dimensions. The cube is a set of dense Cuboids, one per configured
+    combination of dimensions. A query is answered by rolling up the
+    smallest cuboid that has all the dimensions it needs.
+
+    Any column can be a dimension. What matters is the number of cells, the
+    product of the dimensions' distinct value counts, since every cell holds
+    a count and four stats per measure. So a cuboid of a single continuous
+    column is cheap, but combinations of them quickly aren't, and cuboids
+    are capped at MAX_CELLS.
+    """
+    MAX_CELLS = 100000
+    MEASURES = (AGE, HOURS_PER_WEEK, EDUCATION_NUM, INCOME, LOSS)
+    FUNCTIONS = frozenset(['count', 'sum', 'mean', 'std', 'var', 'min', 'max'])
+
+    def __init__(self, cuboids, measures=MEASURES, dtypes=None):
+        """
+        :param cuboids: a list of Cuboid objs
+        :param measures: the measure column names the cuboids have stats for.
+        :param dtypes: a dict of the measure column dtypes in the source data.
+        """
+        self.cuboids = cuboids
+        self.measures = tuple(measures)
+        self.dtypes = dtypes or {}
+
+    @classmethod
+    def from_processor(cls, data_proc, dimension_sets, measures=MEASURES):
+        """
+        Build a cuboid for each set of dimensions.
+        :param data_proc: a DataProcessor obj
+        :param dimension_sets: a list of tuples of dimension column names
+        :param measures: a list of numeric column names
+        :return: a CensusCube obj
+        :raises ValueError: if a set of dimensions has more than MAX_CELLS
+         combinations of values.
+        """
+        cuboids = [Cuboid.from_processor(data_proc, [fix_column_name(dim) for dim in dims], measures,
+                                         max_cells=cls.MAX_CELLS)
+                   for dims in dimension_sets]
+        dtypes = {measure: data_proc.census_data[measure].dtype for measure in measures}
+        return cls(cuboids, measures, dtypes)
+
+    def find_cuboid(self, dims):
+        """
+        The smallest cuboid with all of the dimensions.
+        :param dims: an iterable of dimension column names
+        :return: a Cuboid obj or None if no cuboid has them all.
+        """
+        candidates = [cuboid for cuboid in self.cuboids if set(dims) <= set(cuboid.dims)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda cuboid: cuboid.size)
+
+    def can_answer(self, groupby_cols, aggregations, where=None):
+        """
+        Check whether a normalized query can come from the cube.
+        :param groupby_cols: a tuple of column names
+        :param aggregations: a tuple of (column, tuple of functions) pairs
+        :param where: an optional dict of dimension column names to values
+        :return: a boolean
+        """
+        for col, funcs in aggregations:
+            if col in self.measures:
+                if not set(funcs) <= self.FUNCTIONS:
+                    return False
+            elif set(funcs) != {'count'}:
+                return False
+        return self.find_cuboid(list(groupby_cols) + list(where or {})) is not None
+
+    def aggregate(self, groupby_cols, aggregations, where=None):
+        """
+        Answer a normalized group by query from the cube.
+        :param groupby_cols: a tuple of column names
+        :param aggregations: a tuple of (column, tuple of functions) pairs
+        :param where: an optional dict of dimension column names to lists of
+         values to restrict the records to.
+        :return: a dataframe the same as DataProcessor.compute_query's
+         before it's rounded
+        :raises ValueError: if the cube can't answer the query.
+        """
+        if not self.can_answer(groupby_cols, aggregations, where):
+            raise ValueError('The cube has no cuboid for this query')
+        cuboid = self.find_cuboid(list(groupby_cols) + list(where or {}))
+        measures = [col for col, _ in aggregations if col in self.measures]
+        rolled = cuboid.rollup(groupby_cols, where, measures)
+        count_columns = [col for col, _ in aggregations if col not in self.measures]
+        stats = rolled.to_stats(count_columns)
+        return finish_group_stats(stats, aggregations, self.dtypes)
+
+    def can_describe(self, columns):
+        """
+        Check whether every column is a dimension of some cuboid, so its
+        value counts are in the cube.
+        :param columns: a list of column names
+        :return: a boolean
+        """
+        return all(self.find_cuboid([col]) is not None for col in columns)
+
+    def describe(self, columns):
+        """
+        Compute the stats of pd.DataFrame.describe for some columns from the
+        counts of each of their values in the cube.
+        :param columns: a list of column names. See can_describe.
+        :return: a dataframe with a column of stats per column
+        :raises ValueError: if a column isn't a cube dimension.
+        """
+        if not self.can_describe(columns):
+            raise ValueError('The cube has no value counts for these columns')
+        stats = collections.OrderedDict()
+        for col in columns:
+            along = self.find_cuboid([col]).rollup((col,), measures=())
+            stats[col] = describe_value_counts(pd.Series(along.count, index=along.categories[0]))
+        return pd.DataFrame(stats)
@@ -9,20 +9,32 @@ and loading goes. Dataframe processing code is also here.
 To use:
 This code should be imported into core.py or views.py, etc. not executed here.
 
+The plotly graph objects are in plots.py. Importing plotly is slow, so
+plots.py is only imported by the functions that make plots, the first
+time they're called. sqlalchemy is likewise imported when it's needed.
+
+The data processors are built from the modules next to this one: query.py
+for group by queries and caches, partials.py for mergeable dashboard
+aggregates, cube.py for the data cube and country_index.py for the
+per-country index. The column names they share are in columns.py.
+
 Warnings:
 Importing my_app from the package will cause a circular import error.
 """
+import io
 import os
+import bisect
 import itertools as it
 import numpy as np
 import pandas as pd
-import plotly as plt
-import plotly.graph_objs as go
-import sqlalchemy as sql
 
-AGE = 'Age'
-HOURS_PER_WEEK = 'Hours Per Week'
-OVER_50K = 'Over 50K'
+from .columns import AGE, HOURS_PER_WEEK, OVER_50K, MARRIED, RACE
+from .query import (LRUCache, VersionedValue, fix_column_name, coerce_filter_values, normalize_query,
+                    normalize_filters, check_query_columns, query_result_columns, group_stats,
+                    merge_group_stats, finish_group_stats)
+from .partials import CensusPartials, compute_partials_parallel
+from .cube import CensusCube
+from .country_index import CountryIndex
 
 
 class Colors(object):
@@ -98,6 +110,20 @@ class CSVWriter(object):
         """
         self.query_dataframe.to_csv(self.csv_filename, index=False)
 
+    def write_csv_in_chunks(self, chunk_size):
+        """
+        Fetch the query results from the cursor a chunk at a time and
+        append each chunk to the csv file, so the whole result is never
+        held in a dataframe.
+        :param chunk_size: an integer number of records to fetch at a time.
+        :return: None
+        """
+        with self.engine.connect() as conn:
+            chunks = pd.read_sql_query(self.query, conn, chunksize=chunk_size)
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(self.csv_filename, index=False,
+                             header=i == 0, mode='w' if i == 0 else 'a')
+
 
 class CSVLoader(object):
     """
@@ -132,26 +158,165 @@ class DataProcessor(object):
     Performs processing of the census sample dataframe and provides
     methods for returning table data.
     """
-    def __init__(self, census_data_df):
+    def __init__(self, census_data_df, query_cache_size=128, cube_dimensions=None):
         """
         Let's go ahead and assign the census data as an attribute and
         fix the column names implicitly.
         :param census_data_df: a dataframe containing the census data.
+        :param query_cache_size: how many query_aggregate results to keep.
+        :param cube_dimensions: an optional list of tuples of dimension column
+         names to precompute a CensusCube over. Queries the cube can answer
+         are answered from it.
         """
+        self.version = 0
+        self.codes = {}
+        self.query_cache = LRUCache(query_cache_size)
+        self.cube_dimensions = cube_dimensions
+        self._cube = VersionedValue()
+        self._country_index = VersionedValue()
         self.census_data = census_data_df
         self.list_pages = None
-        self.over_50k_df = None
-        self.under_50k_df = None
         self.fix_names()
 
+    @property
+    def census_data(self):
+        """
+        Return the census dataframe.
+        :return:
+        """
+        return self._census_data
+
+    @census_data.setter
+    def census_data(self, census_data_df):
+        """
+        Replacing the census data makes anything computed from the old
+        data out of date.
+        :param census_data_df: a dataframe containing the census data.
+        :return:
+        """
+        self._census_data = census_data_df
+        self.mark_data_changed()
+
+    def mark_data_changed(self):
+        """
+        Bump the data version so cached results of the old data are no
+        longer used, and drop the category codes of the old data.
+        :return:
+        """
+        self.version += 1
+        self.codes = {}
+
     def fix_names(self):
         """
         Remove the underscores from columns names and put
         them in title case.
         :return:
         """
-        new_columns = [col.replace('_', ' ').title() for col in self.census_data.columns]
+        new_columns = [fix_column_name(col) for col in self.census_data.columns]
         self.census_data.columns = new_columns
+        self.mark_data_changed()
+
+    def category_codes(self, column):
+        """
+        Factorize a column into integer codes and the sorted unique values the
+        codes index into. This is done once per column per data version.
+        :param column: a census data column name
+        :return: a tuple of a numpy array of codes, -1 for missing values, and
+         an index of the unique values.
+        """
+        if column not in self.codes:
+            self.codes[column] = pd.factorize(self.census_data[column], sort=True)
+        return self.codes[column]
+
+    @property
+    def cube(self):
+        """
+        The CensusCube over the configured dimensions, built the first time
+        it's needed after the data changes. None if there are no cube dimensions.
+        :return: a CensusCube obj or None
+        """
+        if not self.cube_dimensions:
+            return None
+        return self._cube.get(self.version, lambda: CensusCube.from_processor(self, self.cube_dimensions))
+
+    @property
+    def country_index(self):
+        """
+        The CountryIndex of the census data, built the first time it's
+        needed after the data changes.
+        :return: a CountryIndex obj
+        """
+        return self._country_index.get(self.version, lambda: CountryIndex.from_processor(self))
+
+    def query_aggregate(self, groupby_cols, agg_dict, filters=None):
+        """
+        Group the census data by any columns and aggregate any columns of
+        the groups. Results are cached by the data version and the query, so
+        asking again, even with the aggregations or filter values in a
+        different order, is a cache lookup.
+
+        The groups are found from the precomputed category codes of the group
+        by columns rather than by hashing the column values each time, or
+        straight from the cube if there is one that covers the query.
+        :param groupby_cols: a list of column names to group by.
+        :param agg_dict: a dict with columns as keys and a list of
+         aggregation functions from QUERY_FUNCTIONS. See aggregate_groupby.
+        :param filters: an optional dict of column names to lists of string
+         values to restrict the records to. See filter_positions.
+        :return: a dataframe indexed by the groups with a (column, function)
+         column for each aggregation in the order they were asked for. Don't
+         modify it, it's shared with the cache.
+        :raises KeyError: if a column isn't in the census data.
+        :raises ValueError: for an empty group by, unknown function, a
+         function other than count of a text column or a filter value of
+         the wrong type.
+        """
+        dtypes = self.census_data.dtypes
+        groupby_cols, aggregations = normalize_query(groupby_cols, agg_dict)
+        check_query_columns(dtypes, groupby_cols, aggregations)
+        where = normalize_filters(dtypes, filters)
+        result = self.query_cache.get_or_compute(
+            (self.version, groupby_cols, aggregations, where),
+            lambda: self.compute_query(groupby_cols, aggregations, where))
+        return result[query_result_columns(agg_dict)]
+
+    def compute_query(self, groupby_cols, aggregations, where=()):
+        """
+        Run a normalized query without the cache.
+        :param groupby_cols: a tuple of column names
+        :param aggregations: a tuple of (column, tuple of functions) pairs
+        :param where: a tuple of (column, tuple of values) pairs from
+         normalize_filters
+        :return: a dataframe
+        """
+        cube = self.cube
+        if cube is not None and cube.can_answer(groupby_cols, aggregations, dict(where)):
+            return round_decimals(cube.aggregate(groupby_cols, aggregations, dict(where)), decimals=2)
+
+        codes = [self.category_codes(col) for col in groupby_cols]
+        shape = tuple(len(uniques) for _, uniques in codes)
+        group_ids = np.zeros(len(self.census_data), dtype=np.int64)
+        has_group = np.ones(len(self.census_data), dtype=bool)
+        for col_codes, uniques in codes:
+            group_ids = group_ids * len(uniques) + col_codes
+            has_group &= col_codes >= 0
+        for col, values in where:
+            has_group &= self.census_data[col].isin(values).values
+
+        value_cols = [col for col, _ in aggregations]
+        values = self.census_data.loc[has_group, value_cols]
+        values.columns = range(len(value_cols))
+        grouped = values.groupby(group_ids[has_group]).agg(
+            {i: list(funcs) for i, (_, funcs) in enumerate(aggregations)})
+        grouped.columns = pd.MultiIndex.from_tuples([(value_cols[i], func) for i, func in grouped.columns])
+
+        level_codes = np.unravel_index(grouped.index.values, shape)
+        grouped.index = pd.MultiIndex.from_arrays(
+            [uniques.take(col_codes) for col_codes, (_, uniques) in zip(level_codes, codes)],
+            names=list(groupby_cols))
+        if len(groupby_cols) == 1:
+            grouped.index = grouped.index.get_level_values(0)
+        return round_decimals(grouped, decimals=2)
 
     def create_married_column(self):
         """
@@ -180,6 +345,92 @@ class DataProcessor(object):
         df = self.census_data.replace('?', '')
         self.list_pages = [df.loc[i : i + page_length] for i in range(0, df_length, page_length)]
 
+    def page_count(self, page_length):
+        """
+        How many pages the census data is split into. The dataframe is
+        chopped up the first time this is called.
+        :param page_length: an integer for how many records per page.
+        :return: an integer
+        """
+        if self.list_pages is None:
+            self.paginate_dataframe(page_length)
+        return len(self.list_pages)
+
+    def get_page(self, page, page_length):
+        """
+        Return one page of the paginated census data.
+        :param page: the page number, starting from 1.
+        :param page_length: an integer for how many records per page.
+        :return: a dataframe
+        """
+        self.page_count(page_length)
+        return self.list_pages[page - 1]
+
+    def page_rows(self, page, page_length):
+        """
+        The row positions of the census data on one page, the same rows
+        get_page shows.
+        :param page: the page number, starting from 1.
+        :param page_length: an integer for how many records per page.
+        :return: a range of row positions
+        """
+        start = (page - 1) * page_length
+        return range(start, start + len(self.get_page(page, page_length)))
+
+    def filter_positions(self, filters=None, rows=None):
+        """
+        Find the row positions of the census records matching every filter.
+        Values are compared against the column as its own dtype so
+        'age=39' matches the integer 39.
+        :param filters: a dict with column names as keys and a list of
+         string values to match as values. Names can be given either as
+         the database column name, i.e. 'over_50k', or as the census data
+         column name, i.e. 'Over 50K'. A record matches a filter if its
+         value is any of the listed values.
+        :param rows: an optional range of row positions to restrict the
+         result to, i.e. a page of the data.
+        :return: a numpy array of integer row positions in ascending order.
+        :raises KeyError: if a filter names a column we don't have.
+        :raises ValueError: if a value can't be converted to the column's dtype.
+        """
+        if rows is None:
+            rows = range(len(self.census_data))
+        frame = self.census_data.iloc[rows.start:rows.stop]
+        matches = np.ones(len(frame), dtype=bool)
+        for column, values in (filters or {}).items():
+            column = fix_column_name(column)
+            if column not in frame.columns:
+                raise KeyError('Unknown filter column {!r}'.format(column))
+            series = frame[column]
+            matches &= series.isin(coerce_filter_values(series.dtype, values)).values
+        return np.flatnonzero(matches) + rows.start
+
+    def iter_records(self, positions, chunk_size):
+        """
+        Yield the census records at the given positions a chunk at a time.
+        Only one chunk is copied out of the census data at once so
+        the full result is never built in memory.
+        :param positions: a numpy array of row positions from filter_positions
+        :param chunk_size: an integer number of records per chunk
+        :return: a generator of dataframes. There is always at least one,
+         possibly empty, dataframe so the column names are available.
+        """
+        yield self.census_data.iloc[positions[:chunk_size]]
+        for start in range(chunk_size, len(positions), chunk_size):
+            yield self.census_data.iloc[positions[start:start + chunk_size]]
+
+    def iter_filtered_records(self, filters, chunk_size, rows=None):
+        """
+        Find the records matching the filters and return a generator of
+        them a chunk at a time. The filters are checked right away.
+        :param filters: a dict of column names to lists of values. See filter_positions
+        :param chunk_size: an integer number of records per chunk
+        :param rows: an optional range of row positions to restrict the records to.
+        :return: a generator of dataframes
+        """
+        positions = self.filter_positions(filters, rows=rows)
+        return self.iter_records(positions, chunk_size)
+
     def describe_census_data(self, decimals=3):
         """
         returns count, mean, std, min, max and quartile info on
@@ -188,6 +439,11 @@ class DataProcessor(object):
         results to
         :return: Returns a pd.DataFrame.
         """
+        columns = [col for col, dtype in self.census_data.dtypes.items()
+                   if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)]
+        cube = self.cube
+        if cube is not None and cube.can_describe(columns):
+            return round_decimals(cube.describe(columns), decimals)
         return round_decimals(self.census_data.describe(), decimals)
 
     def groupby_50k_married_race(self):
@@ -227,6 +483,14 @@ class DataProcessor(object):
         """
         return round_decimals(groupby_obj.agg(agg_dict), decimals=2)
 
+    def aggregate_50k_married_race(self, agg_dict):
+        """
+        Group by over 50k, married and race and aggregate the groups.
+        :param agg_dict: a dict of columns to aggregation functions. See aggregate_groupby
+        :return: a dataframe
+        """
+        return self.query_aggregate([OVER_50K, MARRIED, RACE], agg_dict)
+
     def get_quantile_traces(self):
         """
         Calculate teh quantiles for hours worked for the entire
@@ -234,9 +498,11 @@ class DataProcessor(object):
         :return:  a list of scatter objs from the quantiles of
         hours worked by age.
         """
+        from . import plots
+
         quantiles = [0.1, 0.25, 0.50, 0.75, 0.9]
         quantiles_gb = self.perform_quantile_calculations(quantiles)
-        quantile_traces = make_quantile_traces(quantiles, quantiles_gb)
+        quantile_traces = plots.make_quantile_traces(quantiles, quantiles_gb)
         return quantile_traces
 
     def perform_quantile_calculations(self, quantiles):
@@ -257,190 +523,401 @@ class DataProcessor(object):
         with it
         :return:  a plotly scatter obj
         """
+        from . import plots
+
         agg_dict = {HOURS_PER_WEEK: np.mean}
         groupby = self.groupby([AGE])
         mean_hours_worked = self.aggregate_groupby(groupby, agg_dict)
         mean_x = mean_hours_worked.index.values
         mean_y = mean_hours_worked[HOURS_PER_WEEK].values
-        mean_hours_worked_trace = AvgHoursWorkedTrace(mean_x, mean_y)
+        mean_hours_worked_trace = plots.AvgHoursWorkedTrace(mean_x, mean_y)
         return mean_hours_worked_trace
 
     def get_histo_hours_worked_data(self):
         """
         calculate the truth table of records who makes more than
-        50k per year. Filter the entire dataframe for over and under
-        50k and return those dataframes.
+        50k per year. Filter the hours worked for over and under
+        50k and return those series. Only the one column is copied.
         :return:
         """
         over_50k_truth_table = self.census_data.loc[:, OVER_50K] == 1
-        self.over_50k_df = self.census_data.loc[over_50k_truth_table]
-        over_50k_df = self.over_50k_df[HOURS_PER_WEEK]
-        under_50k_df = self.census_data[HOURS_PER_WEEK].loc[~over_50k_truth_table]
+        hours_worked = self.census_data[HOURS_PER_WEEK]
+        over_50k_df = hours_worked.loc[over_50k_truth_table]
+        under_50k_df = hours_worked.loc[~over_50k_truth_table]
         return over_50k_df, under_50k_df
 
+    def get_histo_hours_worked_traces(self):
+        """
+        Split hours worked by over and under 50k and make the
+        histogram traces for them.
+        :return: a list of histogram objs
+        """
+        from . import plots
+
+        over_50k_df, under_50k_df = self.get_histo_hours_worked_data()
+        return plots.get_histo_hours_worked_traces(over_50k_df, under_50k_df)
+
     def get_country_data(self):
         """
         Get a count of where records are form who make
-        more than 50k.
+        more than 50k, from the country index.
 
-        :return: returns a dataframe of counts by country
+        :return: returns a series of counts by country
         """
-        over_50k_tt = ~self.over_50k_df['Country'].isin(['United-States', '?'])
-        over_50k_origins = self.over_50k_df[over_50k_tt]
-        over_50k_origins_gb = over_50k_origins.groupby(['Country'])
-        over_50k_origins_count = over_50k_origins_gb['Country'].count()
-        return over_50k_origins_count
+        return self.country_index.over_50k_counts()
 
 
-class GenericScatterTrace(go.Scatter):
+class PartialsDashboard(object):
     """
-    This is a generic scatter trace inheriting from go.Scatter. Any common attributes 
-    could be assigned here if they'll be set for all scatter traces.
-    
-    Unfortunately, we can't use property decorator since plotly won't let us add
-    new attributes to graph_obj (go.*) objects. It checks this in the 
-    PlotlyDict.__setitem__ method. It would be nice to set up a function 
-    to check if x is a dataframe and just take the index or the values for x and y respec.
-    
-    I _could_ override the __setitem__ method but that _could_ also break the crap out
-    of the Scatter obj/plotly so let's don't and say we didn't.
+    The dashboard methods of a data processor whose aggregates all come from
+    a CensusPartials obj. Subclasses provide it as the partials attribute.
     """
-    def __init__(self, x=None, y=None, marker_size=5):
-        super().__init__(x=x, y=y)
-        self.x = x
-        self.y = y
-        self.marker.size = marker_size
+    partials = None
+
+    def describe_census_data(self, decimals=3):
+        """
+        returns count, mean, std, min, max and quartile info on
+        continuous columns.
+        :param decimals: how many decimals to round the results to
+        :return: Returns a pd.DataFrame.
+        """
+        return round_decimals(self.partials.describe(), decimals)
 
+    def aggregate_50k_married_race(self, agg_dict):
+        """
+        Group by over 50k, married and race and aggregate the groups.
+        :param agg_dict: a dict of columns to 'count' and 'mean' functions.
+        :return: a dataframe
+        """
+        return round_decimals(self.partials.aggregate_groups(agg_dict), decimals=2)
 
-class HoursWorkedQuantileTrace(GenericScatterTrace):
-    """
-    Handles and sets standard attributes for the hours worked trace of all the hours
-    worked records. This would be more useful if it were'nt a one off and we 
-    were doing lots of scatter traces. Then we could set standard attributes of the
-    trace for lots of plots.
-    """
-    opacity_dict = {'0.1' : 0.3,
-                    '0.25': 0.7,
-                    '0.5' : 1.0,
-                    '0.75': 0.7,
-                    '0.9' : 0.3}
+    def get_quantile_traces(self):
+        """
+        Make the scatter objs of the hours worked quantiles by age.
+        :return: a list of scatter objs
+        """
+        from . import plots
 
-    def __init__(self, x=None, y=None, quantile=None):
-        super().__init__(x=x, y=y)
-        self.mode = 'lines+markers'
-        self.marker.color = Colors.BLUE
-        self.marker.opacity = self.opacity_dict[str(quantile)]
-        self.opacity = self.opacity_dict[str(quantile)]
-        self.name = '{} Quantile'.format(quantile)
+        quantiles = [0.1, 0.25, 0.50, 0.75, 0.9]
+        quantiles_gb = self.partials.hours_quantiles_by_age(quantiles)
+        return plots.make_quantile_traces(quantiles, quantiles_gb)
 
+    def get_mean_trace(self):
+        """
+        Make the scatter trace of mean hours per week by age.
+        :return: a plotly scatter obj
+        """
+        from . import plots
 
-class AvgHoursWorkedTrace(GenericScatterTrace):
-    """
-    Contains attributes specific to the mean hours worked trace on the hours worked plot.
-    Set this to use lines and markers.
-    """
-    def __init__(self, x=None, y=None, marker_size=8):
-        super().__init__(x=x, y=y)
-        self.mode = 'lines+markers'
-        self.marker.color = Colors.RED
-        self.marker.size = marker_size
-        self.name = 'Mean hours worked<br>at each age'
+        mean_hours_worked = round_decimals(self.partials.mean_hours_by_age(), decimals=2)
+        return plots.AvgHoursWorkedTrace(mean_hours_worked.index.values, mean_hours_worked.values)
 
+    def get_histo_hours_worked_traces(self):
+        """
+        Make the histogram traces of hours worked from counts of each
+        hours value for over and under 50k.
+        :return: a list of histogram objs
+        """
+        from . import plots
 
-class HoursWorkedLayout(go.Layout):
-    """
-    The plotly template object of the hours worked plot.
-    
-    Inherits from plotly.graph_objs.Layout object.
-    """
-    def __init__(self, height=600):
-        super().__init__()
-        self.title = "<b>Hours Per Week Worked by Age</b><br><i>with average hours worked by age</i>"
-        self.yaxis.title = HOURS_PER_WEEK
-        self.xaxis.title = AGE
-        self.height = height
+        over_50k_counts, under_50k_counts = self.partials.hours_counts_by_income()
+        return plots.get_histo_hours_worked_count_traces(over_50k_counts, under_50k_counts)
+
+    def get_country_data(self):
+        """
+        Get a count of where records are from who make more than 50k.
+        :return: returns a series of counts by country
+        """
+        return self.partials.over_50k_country_counts()
 
 
-class PlotlyFigure(go.Figure):
+class ChunkedDataProcessor(PartialsDashboard):
     """
-    the hours worked scatter figure with go.Data object
-    conversion and sets the layout.
+    Provides the same dashboard data as DataProcessor for census data that is
+    too big to hold in memory. The source is read a chunk at a time and
+    reduced to CensusPartials, so memory use is bounded by the chunk size
+    and the number of distinct values rather than the number of records.
+
+    The paginated view and exports read the source again, starting at the
+    chunk the rows they want are in and stopping as soon as they have them.
+    Where each chunk starts is noted during the partials pass.
     """
-    def __init__(self, data=None, layout=None):
-        super().__init__()
-        self.data = go.Data(data)
-        self.layout = layout
+    # The source isn't changed by us so there is only one version of the data.
+    version = 0
 
+    def __init__(self, read_chunks, query_cache_size=128):
+        """
+        :param read_chunks: a callable that returns a new iterator over
+         (position, dataframe chunk) pairs of the raw source each time it's
+         called. Called with one of the positions it yielded, it starts
+         reading at that chunk.
+        :param query_cache_size: how many query_aggregate results to keep.
+        """
+        self.read_chunks = read_chunks
+        self._partials = VersionedValue()
+        self.dtypes = None
+        self.query_cache = LRUCache(query_cache_size)
+        # The first row of each chunk and the source position to read it from.
+        self.chunk_rows = []
+        self.chunk_positions = []
+
+    @classmethod
+    def from_csv(cls, csv_file, chunk_size, **kwargs):
+        """
+        Read the census data from the flattened csv file.
+        :param csv_file: a file path to our csv
+        :param chunk_size: an integer number of records to read at a time.
+        :param kwargs: passed on to ChunkedDataProcessor
+        :return: a ChunkedDataProcessor obj
+        """
+        return cls(lambda position=None: read_csv_chunks(csv_file, chunk_size, position), **kwargs)
 
-class HistogramHoursWorked(go.Histogram):
-    """
-    Histogram object to use. The bin sizing requires both
-    the autobinx to be false and the dict set for xins.
+    @classmethod
+    def from_sql(cls, sqlite_file, query_file, chunk_size, **kwargs):
+        """
+        Read the census data straight from the database with the
+        flattening query, fetching from the cursor a chunk at a time.
+        :param sqlite_file: the filepath/name of the sqlite db.
+        :param query_file: the filepath/name of the sql query.
+        :param chunk_size: an integer number of records to fetch at a time.
+        :param kwargs: passed on to ChunkedDataProcessor
+        :return: a ChunkedDataProcessor obj
+        """
+        engine = get_database_engine(sqlite_file)
+        query = get_file_contents(query_file).strip().rstrip(';')
 
-    We use the colors class attribute to give both
-    attributes different colors without having to set them
-    manually. We're also using norm to set this to a probability
-    histogram intead of a count.
-    """
-    colors = Colors()
+        def read_chunks(position=None):
+            # The position of a chunk is its first row, skipped to with OFFSET.
+            start = position or 0
+            sql = query if not start else 'SELECT * FROM ({}) LIMIT -1 OFFSET {:d}'.format(query, start)
+            with engine.connect() as conn:
+                for chunk in pd.read_sql_query(sql, conn, chunksize=chunk_size):
+                    yield start, chunk
+                    start += len(chunk)
 
-    def __init__(self, name=None, x=None, opacity=0.5,
-                 line_width=1, norm='probability'):
-        super().__init__()
-        self.x = x
-        self.opacity = opacity
-        self.histnorm = norm
-        self.autobinx = False
-        self.xbins = {'start': 0, 'end': 100, 'size': 3}
-        self.name = name
-        self.marker.line.width = line_width
-        self.marker.color = self.colors.next_color()
+        return cls(read_chunks, **kwargs)
 
+    def iter_chunks(self, position=None):
+        """
+        Read the source and yield each chunk with fixed column names
+        and the married column, the same as DataProcessor.census_data.
+        :param position: an optional source position to start reading from.
+        :return: a generator of dataframes
+        """
+        for _, chunk in self.iter_positioned_chunks(position):
+            yield chunk
 
-class HistogramLayout(go.Layout):
-    """
-    Subclass the layout for the histogram with default titles.
-    barmode is 'overlay' so that the two histograms will be overlaid and
-    not side by side.
-    """
-    def __init__(self, height=600):
-        super().__init__()
-        self.barmode = 'overlay'
-        self.title = "<b>Probability Histogram of Hours Worked Per Week for<br>People with Incomes over and under 50k</b>"
-        self.xaxis.title = 'Hours Worked per Week'
-        self.yaxis.title = 'Probability of Working X Hours Per Week'
-        self.height = height
+    def iter_positioned_chunks(self, position=None):
+        """
+        The same as iter_chunks but yielding each chunk's source position too.
+        :param position: an optional source position to start reading from.
+        :return: a generator of (position, dataframe) pairs
+        """
+        for position, chunk in self.read_chunks(position):
+            data_proc = DataProcessor(chunk)
+            data_proc.create_married_column()
+            yield position, data_proc.census_data
 
+    @property
+    def partials(self):
+        """
+        The partial aggregates of the whole source. They're computed with a
+        single pass over the source the first time they're needed. Threads
+        asking at the same time wait for that one pass.
+        :return: a CensusPartials obj
+        """
+        return self._partials.get(self.version, self.compute_partials)
 
-class ChoroplethOrigins(go.Choropleth):
-    """
-    subclass the choropleth graph obj to assign
-    attrs automatically. Important attrs here are
-    locationmode, locations, z and text
-    """
-    def __init__(self, z=None):
-        super().__init__()
-        self.locations = z.index
-        self.locationmode = 'country names'
-        self.z = z
-        self.text = z.index
-        self.marker.line.color = Colors.LIGHT_GRAY
+    def compute_partials(self):
+        """
+        Read the whole source and reduce it to partial aggregates, noting
+        where each chunk starts on the way.
+        :return: a CensusPartials obj
+        """
+        partials = CensusPartials()
+        chunk_rows, chunk_positions = [], []
+        rows = 0
+        for position, chunk in self.iter_positioned_chunks():
+            if self.dtypes is None:
+                self.dtypes = chunk.dtypes
+            chunk_rows.append(rows)
+            chunk_positions.append(position)
+            rows += len(chunk)
+            partials = partials.merge(CensusPartials.from_frame(chunk))
+        self.chunk_rows, self.chunk_positions = chunk_rows, chunk_positions
+        return partials
+
+    def page_count(self, page_length):
+        """
+        How many pages of records the source has.
+        :param page_length: an integer for how many records per page.
+        :return: an integer
+        """
+        return max(1, -(-self.partials.record_count // page_length))
+
+    def get_page(self, page, page_length):
+        """
+        Read a single page of records from the source.
+        :param page: the page number, starting from 1.
+        :param page_length: an integer for how many records per page.
+        :return: a dataframe
+        """
+        frames = list(self.iter_rows(self.page_rows(page, page_length)))
+        return pd.concat(frames).replace('?', '')
+
+    def page_rows(self, page, page_length):
+        """
+        The row positions of the records on one page. The last page
+        stops at the last record.
+        :param page: the page number, starting from 1.
+        :param page_length: an integer for how many records per page.
+        :return: a range of row positions
+        """
+        start = (page - 1) * page_length
+        return range(start, min(start + page_length, self.partials.record_count))
+
+    def iter_rows(self, rows):
+        """
+        Yield the parts of each chunk that fall in a range of row positions,
+        starting at the chunk the range starts in and stopping once the range
+        has been read. The chunks keep the row positions in the source as
+        their index.
+        :param rows: a range of row positions
+        :return: a generator of dataframes. There is always at least one,
+         possibly empty, dataframe.
+        """
+        self.partials
+        first = max(bisect.bisect_right(self.chunk_rows, rows.start) - 1, 0)
+        offset, position = 0, None
+        if self.chunk_rows:
+            offset, position = self.chunk_rows[first], self.chunk_positions[first]
+        last_chunk = None
+        for chunk in self.iter_chunks(position):
+            start = offset
+            offset += len(chunk)
+            last_chunk = chunk
+            if offset <= rows.start:
+                continue
+            chunk.index = pd.RangeIndex(start, offset)
+            yield chunk.iloc[max(rows.start - start, 0):rows.stop - start]
+            if offset >= rows.stop:
+                return
+            last_chunk = None
+        if last_chunk is not None:
+            yield last_chunk.iloc[:0]
+
+    def column_dtypes(self):
+        """
+        The dtypes of the census data columns. If the source hasn't been
+        read yet, they're taken from its first chunk.
+        :return: a series of dtypes indexed by column name
+        """
+        if self.dtypes is None:
+            self.dtypes = next(self.iter_chunks()).dtypes
+        return self.dtypes
+
+    def query_aggregate(self, groupby_cols, agg_dict, filters=None):
+        """
+        Group the census data by any columns and aggregate any columns of the
+        groups, the same as DataProcessor.query_aggregate. Each chunk is
+        reduced to mergeable group stats so median isn't available, and only
+        count is available for text columns.
+        :param groupby_cols: a list of column names to group by.
+        :param agg_dict: a dict with columns as keys and a list of
+         aggregation functions.
+        :param filters: an optional dict of column names to lists of string
+         values to restrict the records to.
+        :return: a dataframe. Don't modify it, it's shared with the cache.
+        :raises KeyError: if a column isn't in the census data.
+        :raises ValueError: for an empty group by, unsupported function or
+         a filter value of the wrong type.
+        """
+        dtypes = self.column_dtypes()
+        groupby_cols, aggregations = normalize_query(groupby_cols, agg_dict)
+        check_query_columns(dtypes, groupby_cols, aggregations)
+        where = normalize_filters(dtypes, filters)
+        result = self.query_cache.get_or_compute(
+            (self.version, groupby_cols, aggregations, where),
+            lambda: self.compute_query(groupby_cols, aggregations, where))
+        return result[query_result_columns(agg_dict)]
+
+    def compute_query(self, groupby_cols, aggregations, where=()):
+        """
+        Run a normalized query over the source without the cache.
+        :param groupby_cols: a tuple of column names
+        :param aggregations: a tuple of (column, tuple of functions) pairs
+        :param where: a tuple of (column, tuple of values) pairs from
+         normalize_filters
+        :return: a dataframe
+        """
+        value_cols = [col for col, _ in aggregations]
+        stats = None
+        for chunk in self.iter_chunks():
+            for col, values in where:
+                chunk = chunk[chunk[col].isin(values).values]
+            stats = merge_group_stats(stats, group_stats(chunk, list(groupby_cols), value_cols))
+        return round_decimals(finish_group_stats(stats, aggregations, self.column_dtypes()), decimals=2)
+
+    def iter_filtered_records(self, filters, chunk_size, rows=None):
+        """
+        Check the filters and return a generator of the matching records
+        as they're read from the source.
+        :param filters: a dict of column names to lists of values. See
+         DataProcessor.filter_positions
+        :param chunk_size: unused. Records come out in the source's chunks.
+        :param rows: an optional range of row positions to restrict the records to.
+        :return: a generator of dataframes
+        :raises KeyError: if a filter names a column we don't have.
+        :raises ValueError: if a value can't be converted to the column's dtype.
+        """
+        coerced = normalize_filters(self.column_dtypes(), filters)
+
+        def generate():
+            chunks = self.iter_chunks() if rows is None else self.iter_rows(rows)
+            for i, chunk in enumerate(chunks):
+                matches = np.ones(len(chunk), dtype=bool)
+                for column, values in coerced:
+                    matches &= chunk[column].isin(values).values
+                if i == 0 or matches.any():
+                    yield chunk[matches]
 
+        return generate()
 
-class ChoroLayout(go.Layout):
+
+class PartitionedDataProcessor(PartialsDashboard, DataProcessor):
     """
-    A layout for the choropleth plot with project defaults.
+    A DataProcessor that computes the dashboard aggregates on every core.
+    The rows are split into a partition per process and each process reduces
+    its partition to CensusPartials, which are merged here.
+
+    The processes read the census columns from memory mapped files rather
+    than being sent the data. Only the file names, row ranges and the
+    small partials are pickled between processes.
     """
-    def __init__(self, height=500):
-        super().__init__()
-        self.height = height
-        self.geo.showframe = True
-        self.geo.showcoastlines = True
-        self.geo.projection.type = 'Mercator'
-        self.title = "<b>Home Country of Respondents Who Make<br>More Than $50K</b>"
+    def __init__(self, census_data_df, processes=None, **kwargs):
+        """
+        :param census_data_df: a dataframe containing the census data.
+        :param processes: how many processes to use. Defaults to the number of cores.
+        :param kwargs: passed on to DataProcessor
+        """
+        super().__init__(census_data_df, **kwargs)
+        self.processes = processes
+        self._partials = VersionedValue()
+
+    @property
+    def partials(self):
+        """
+        The partial aggregates of the census data, computed in parallel the
+        first time they're needed after the data changes. Threads asking at
+        the same time wait for one computation rather than each starting a
+        pool of processes.
+        :return: a CensusPartials obj
+        """
+        return self._partials.get(self.version, lambda: compute_partials_parallel(
+            self.census_data, self.processes, category_codes=self.category_codes))
 
 
-def write_csv_file(sqlite_file, query_file, csv_file):
+def write_csv_file(sqlite_file, query_file, csv_file, chunk_size=None):
     """
     Get the data from the SQLite database into a dataframe and
     then save as a CSV.
@@ -448,19 +925,117 @@ def write_csv_file(sqlite_file, query_file, csv_file):
     The default options are used for the CSVWriter object and fill_dataframe
     methods but they could be assigned here or used with
     different values elsewhere.
+    :param chunk_size: if given, the data is fetched and written this many
+        records at a time instead of all at once.
     :return: Nada
     """
     csv = CSVWriter(db_file=sqlite_file, query_file=query_file, csv_file=csv_file)
+    if chunk_size:
+        csv.write_csv_in_chunks(chunk_size)
+        return
     csv.fill_dataframe()
     csv.write_csv()
 
 
+def read_csv_chunks(csv_file, chunk_size, position=None):
+    """
+    Read a csv file a chunk of records at a time along with the byte offset
+    each chunk starts at, so a later read can seek straight to a chunk.
+    Records are split at line ends, so fields can't contain newlines.
+    :param csv_file: a file path to a csv with a header line
+    :param chunk_size: an integer number of records per chunk
+    :param position: an optional byte offset of a chunk to start reading at.
+    :return: a generator of (byte offset, dataframe) pairs
+    """
+    with open(csv_file, 'rb') as csv:
+        header = csv.readline()
+        if position is not None:
+            csv.seek(position)
+        while True:
+            position = csv.tell()
+            lines = list(it.islice(csv, chunk_size))
+            if not lines:
+                return
+            yield position, pd.read_csv(io.BytesIO(header + b''.join(lines)))
+
+
+def iter_csv(frames):
+    """
+    Turn dataframe chunks into chunks of csv text. Only the first chunk
+    gets the header row.
+    :param frames: an iterable of dataframes with the same columns
+    :return: a generator of csv strings
+    """
+    header = True
+    for frame in frames:
+        yield frame.to_csv(index=False, header=header)
+        header = False
+
+
+def iter_ndjson(frames):
+    """
+    Turn dataframe chunks into newline delimited json, one object per record.
+    :param frames: an iterable of dataframes
+    :return: a generator of json strings
+    """
+    for frame in frames:
+        if len(frame):
+            yield frame.to_json(orient='records', lines=True).rstrip('\n') + '\n'
+
+
+def iter_arrow(frames):
+    """
+    Turn dataframe chunks into an Arrow IPC stream with one record
+    batch per chunk.
+
+    pyarrow is an optional dependency. It is imported here, before the
+    generator starts, so a missing install is raised to the caller and
+    not in the middle of a response.
+    :param frames: an iterable of dataframes with the same columns
+    :return: a generator of bytes
+    :raises ImportError: if pyarrow isn't installed.
+    """
+    import pyarrow as pa
+
+    def drain(sink):
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    def generate():
+        sink = io.BytesIO()
+        writer = None
+        for frame in frames:
+            batch = pa.RecordBatch.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pa.RecordBatchStreamWriter(sink, batch.schema)
+            writer.write_batch(batch)
+            yield drain(sink)
+        if writer is not None:
+            writer.close()
+            yield drain(sink)
+
+    return generate()
+
+
+"""
+The export formats we can stream. Each maps to the function turning
+dataframe chunks into response chunks, the mimetype and file extension.
+"""
+EXPORT_FORMATS = {'csv':    (iter_csv,    'text/csv',                            'csv'),
+                  'ndjson': (iter_ndjson, 'application/x-ndjson',                'ndjson'),
+                  'arrow':  (iter_arrow,  'application/vnd.apache.arrow.stream', 'arrow')}
+
+
 def get_database_engine(sql_file_path):
     """
     Instantiate and return a sqlalchemy database engine
     :param sql_file_path: the filepath/name of the sqlite db.
     :return: instantiated sqlalchemy engine
     """
+    import sqlalchemy as sql
+
     conn_string = 'sqlite:///{}'.format(sql_file_path)
     engine = sql.create_engine(conn_string)
     return engine
@@ -562,51 +1137,5 @@ def get_full_path(file_name):
     return os.path.join(module_dir, file_name)
 
 
-def get_plotly_div_str(figure_obj, image_height=800):
-    """
-    Gets the html for the div created by the plotly plot.
-    :param figure_obj: a plotly graph_objs Figure object with data and layout objects
-    :param image_height: an integer for the image height
-    :return: returns a string of html wrapped in a div element.
-    """
-    return plt.offline.plot(figure_obj,
-                            include_plotlyjs=False,
-                            output_type='div',
-                            show_link=False,
-                            image_height=image_height)
-
-
-def make_quantile_traces(quantile_list, quantiles_gb):
-    """
-    Calculate and return quantiles.
-    The quantiles are in the top level of the hiearchical index.
-
-    :param quantile_list: A list of decimal values which are the quantiles
-        values  we want ot calculate.
-    :param quantiles_gb: the dataframe groupby object we'll locate the
-        quantiles values in.
-    :return:
-    """
-    q_traces = []
-    for q in quantile_list:
-        x = quantiles_gb.loc[q].index.values
-        y = quantiles_gb.loc[q].values
-        trace = HoursWorkedQuantileTrace(x=x, y=y, quantile=q)
-        q_traces.append(trace)
-    return q_traces
-
-
-def get_histo_hours_worked_traces(over_50k_df, under_50k_df):
-    """
-    Gets histogram objects from passed dataframes.
-    :param over_50k_df: a pandas dataframe.
-    :param under_50k_df: a pandas dataframe.
-    :return:
-    """
-    over_50k_histo = HistogramHoursWorked(x=over_50k_df, name='Over $50K')
-    under_50k_histo = HistogramHoursWorked(x=under_50k_df, name='Under $50K')
-    return [over_50k_histo, under_50k_histo]
-
-
 if __name__ == '__main__':
     pass
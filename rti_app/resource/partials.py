@@ -0,0 +1,336 @@
+"""
+Author: Scott Dillon
+Email: scott.dillon@gmail.com
+
+Partial aggregates of the census data for the dashboard. CensusPartials
+are computed from any slice of the records and merged, so the dashboard can
+be computed a chunk at a time or by a pool of processes, one partition of
+the records each.
+"""
+import os
+import shutil
+import tempfile
+import multiprocessing
+import itertools as it
+import numpy as np
+import pandas as pd
+
+from .columns import AGE, HOURS_PER_WEEK, EDUCATION_NUM, OVER_50K, MARRIED, RACE, COUNTRY
+
+
+class CensusPartials(object):
+    """
+    Partial aggregates of the census data that the dashboard is computed
+    from. Partials are built from any slice of the records and merged by
+    adding them together, so the dashboard can be computed from data that
+    is read a chunk at a time or split across processes.
+
+    Everything is kept as counts and sums keyed by the values of low
+    cardinality columns. The memory they take depends on how many distinct
+    values there are, not how many records.
+
+    value_counts:          a dict of numeric column name -> counts of each value.
+                           Enough for exact describe stats including quartiles.
+    group_sums:            count and sums of the GROUP_MEAN_COLUMNS by GROUP_COLUMNS
+    age_hours_counts:      record counts by age and hours per week
+    income_hours_counts:   record counts by over 50k and hours per week
+    income_country_counts: record counts by over 50k and country
+    """
+    GROUP_COLUMNS = [OVER_50K, MARRIED, RACE]
+    GROUP_MEAN_COLUMNS = [AGE, HOURS_PER_WEEK, EDUCATION_NUM]
+    COUNT = 'count'
+
+    def __init__(self, value_counts=None, group_sums=None, age_hours_counts=None,
+                 income_hours_counts=None, income_country_counts=None):
+        self.value_counts = value_counts or {}
+        self.group_sums = group_sums
+        self.age_hours_counts = age_hours_counts
+        self.income_hours_counts = income_hours_counts
+        self.income_country_counts = income_country_counts
+
+    @classmethod
+    def from_frame(cls, census_data):
+        """
+        Compute the partials for a dataframe of census records with
+        fixed names and a married column.
+        :param census_data: a dataframe
+        :return: a CensusPartials obj
+        """
+        numeric_columns = census_data.select_dtypes(include=[np.number]).columns
+        value_counts = {col: census_data[col].value_counts() for col in numeric_columns}
+
+        groupby = census_data.groupby(cls.GROUP_COLUMNS)
+        group_sums = groupby[cls.GROUP_MEAN_COLUMNS].sum()
+        group_sums[cls.COUNT] = groupby.size()
+
+        return cls(value_counts=value_counts,
+                   group_sums=group_sums,
+                   age_hours_counts=census_data.groupby([AGE, HOURS_PER_WEEK]).size(),
+                   income_hours_counts=census_data.groupby([OVER_50K, HOURS_PER_WEEK]).size(),
+                   income_country_counts=census_data.groupby([OVER_50K, COUNTRY]).size())
+
+    def merge(self, other):
+        """
+        Add two partials together.
+        :param other: a CensusPartials obj
+        :return: a new CensusPartials obj covering the records of both.
+        """
+        value_counts = dict(self.value_counts)
+        for col, counts in other.value_counts.items():
+            value_counts[col] = add_counts(value_counts.get(col), counts)
+        return CensusPartials(value_counts=value_counts,
+                              group_sums=add_counts(self.group_sums, other.group_sums),
+                              age_hours_counts=add_counts(self.age_hours_counts, other.age_hours_counts),
+                              income_hours_counts=add_counts(self.income_hours_counts, other.income_hours_counts),
+                              income_country_counts=add_counts(self.income_country_counts, other.income_country_counts))
+
+    @property
+    def record_count(self):
+        """
+        The number of records these partials were computed from.
+        :return: an integer
+        """
+        if self.group_sums is None:
+            return 0
+        return int(self.group_sums[self.COUNT].sum())
+
+    def describe(self, columns=None):
+        """
+        The same stats as pd.DataFrame.describe for the numeric columns.
+        :param columns: the column names in the order we want them. Defaults
+         to every column with value counts.
+        :return: a dataframe with a column per census column.
+        """
+        columns = columns or list(self.value_counts)
+        stats = {col: describe_value_counts(self.value_counts[col]) for col in columns}
+        return pd.DataFrame(stats, columns=columns)
+
+    def aggregate_groups(self, agg_dict):
+        """
+        The equivalent of DataProcessor.aggregate_50k_married_race for
+        partials. Only count and mean can be computed from counts and sums.
+        :param agg_dict: a dict of column names to a list of 'count' and/or
+         'mean' for the columns in GROUP_MEAN_COLUMNS. Any column can be counted.
+        :return: a dataframe indexed by the group columns with a column for
+         each column and function pair.
+        :raises ValueError: for an aggregation we can't do.
+        """
+        sums = self.group_sums[self.group_sums[self.COUNT] > 0]
+        results = {}
+        for col, funcs in agg_dict.items():
+            for func in funcs:
+                if func == 'count':
+                    results[(col, func)] = sums[self.COUNT].astype(int)
+                elif func == 'mean' and col in self.GROUP_MEAN_COLUMNS:
+                    results[(col, func)] = sums[col] / sums[self.COUNT]
+                else:
+                    raise ValueError('Cannot compute {} of {} from partials'.format(func, col))
+        columns = pd.MultiIndex.from_tuples([(col, func) for col, funcs in agg_dict.items()
+                                             for func in funcs])
+        return pd.DataFrame(results, index=sums.index, columns=columns)
+
+    def hours_quantiles_by_age(self, quantiles):
+        """
+        Quantiles of hours per week at each age, indexed the same way as
+        DataProcessor.perform_quantile_calculations.
+        :param quantiles: a list of decimal values
+        :return: a series with a (quantile, age) index
+        """
+        counts = self.age_hours_counts[self.age_hours_counts > 0]
+        values = {}
+        for age, age_counts in counts.groupby(level=0):
+            hours_counts = age_counts.reset_index(level=0, drop=True).sort_index()
+            for q in quantiles:
+                values[(q, age)] = weighted_quantile(hours_counts, q)
+        index = pd.MultiIndex.from_tuples(sorted(values), names=[None, AGE])
+        return pd.Series([values[key] for key in index], index=index, name=HOURS_PER_WEEK)
+
+    def mean_hours_by_age(self):
+        """
+        The mean hours per week at each age.
+        :return: a series indexed by age
+        """
+        counts = self.age_hours_counts
+        hours = counts.index.get_level_values(1).values
+        total_hours = (counts * hours).groupby(level=0).sum()
+        records = counts.groupby(level=0).sum()
+        mean_hours = (total_hours / records)[records > 0]
+        mean_hours.index.name = AGE
+        return mean_hours.rename(HOURS_PER_WEEK)
+
+    def hours_counts_by_income(self):
+        """
+        Counts of hours per week for over and under 50k.
+        :return: a tuple of series of counts indexed by hours per week,
+         one for over 50k and one for under.
+        """
+        counts = self.income_hours_counts.astype(int)
+        over_50k = counts.index.get_level_values(0) == 1
+        over_50k_counts = counts[over_50k].reset_index(level=0, drop=True)
+        under_50k_counts = counts[~over_50k].reset_index(level=0, drop=True)
+        return over_50k_counts, under_50k_counts
+
+    def over_50k_country_counts(self, exclude=('United-States', '?')):
+        """
+        Count where records are from who make more than 50k.
+        :param exclude: countries to leave out
+        :return: a series of counts indexed by country
+        """
+        counts = self.income_country_counts.astype(int)
+        over_50k = counts.index.get_level_values(0) == 1
+        country_counts = counts[over_50k].reset_index(level=0, drop=True)
+        country_counts = country_counts[~country_counts.index.isin(exclude) & (country_counts > 0)]
+        country_counts.index.name = COUNTRY
+        return country_counts.sort_index().rename(COUNTRY)
+
+
+def add_counts(counts, other_counts):
+    """
+    Add two series or dataframes of counts and sums together by index,
+    treating missing labels as 0. Either can be None.
+    :param counts: a pandas series/dataframe or None
+    :param other_counts: a pandas series/dataframe or None
+    :return: the sum
+    """
+    if counts is None:
+        return other_counts
+    if other_counts is None:
+        return counts
+    return counts.add(other_counts, fill_value=0)
+
+
+def weighted_quantile(value_counts, quantile):
+    """
+    The quantile of the values a series of counts describes, using the
+    same linear interpolation as pd.Series.quantile.
+    :param value_counts: a series of counts indexed by value, sorted by value.
+    :param quantile: a decimal value between 0 and 1
+    :return: a float
+    """
+    value_counts = value_counts[value_counts > 0]
+    values = value_counts.index.values
+    cumulative = np.cumsum(value_counts.values)
+    position = (cumulative[-1] - 1) * quantile
+    lower = int(np.floor(position))
+    upper = min(lower + 1, int(cumulative[-1]) - 1)
+    lower_value = values[np.searchsorted(cumulative, lower, side='right')]
+    upper_value = values[np.searchsorted(cumulative, upper, side='right')]
+    return lower_value + (position - lower) * (upper_value - lower_value)
+
+
+def describe_value_counts(value_counts):
+    """
+    Compute the stats of pd.Series.describe from the counts of each value.
+    :param value_counts: a series of counts indexed by value
+    :return: a series with count, mean, std, min, quartiles and max
+    """
+    value_counts = value_counts[value_counts > 0].sort_index()
+    values = value_counts.index.values.astype(float)
+    counts = value_counts.values.astype(float)
+    count = counts.sum()
+    mean = (values * counts).sum() / count
+    std = np.sqrt((counts * (values - mean) ** 2).sum() / (count - 1)) if count > 1 else np.nan
+    return pd.Series([count, mean, std, values[0],
+                      weighted_quantile(value_counts, 0.25),
+                      weighted_quantile(value_counts, 0.5),
+                      weighted_quantile(value_counts, 0.75),
+                      values[-1]],
+                     index=['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max'])
+
+
+def write_memmap_columns(census_data, columns, directory, category_codes=None):
+    """
+    Write census data columns to memory mapped files. Numeric and boolean
+    columns are written as they are. Other columns are written as integer
+    codes and the list of values the codes stand for is kept alongside.
+    :param census_data: a dataframe
+    :param columns: a list of column names to write
+    :param directory: the directory to put the files in
+    :param category_codes: an optional callable returning the codes and unique
+     values of a column, i.e. DataProcessor.category_codes. Defaults to factorizing.
+    :return: a dict of column name to a tuple of the file name, dtype string,
+     length and an index of the values for coded columns or None.
+    """
+    specs = {}
+    for col in columns:
+        series = census_data[col]
+        categories = None
+        if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+            values = np.asarray(series)
+        else:
+            if category_codes is None:
+                values, categories = pd.factorize(series)
+            else:
+                values, categories = category_codes(col)
+            categories = pd.Index(categories)
+        file_name = os.path.join(directory, '{}.dat'.format(len(specs)))
+        mapped = np.memmap(file_name, dtype=values.dtype, mode='w+', shape=values.shape)
+        mapped[:] = values
+        mapped.flush()
+        del mapped
+        specs[col] = (file_name, values.dtype.str, len(values), categories)
+    return specs
+
+
+def compute_partition_partials(column_specs, start, stop):
+    """
+    Compute the CensusPartials of a range of rows from memory mapped
+    columns. This runs in the worker processes.
+    :param column_specs: a dict from write_memmap_columns
+    :param start: the first row position of the partition
+    :param stop: the row position after the last one of the partition
+    :return: a CensusPartials obj
+    """
+    columns = {}
+    for col, (file_name, dtype, length, categories) in column_specs.items():
+        values = np.memmap(file_name, dtype=dtype, mode='r', shape=(length,))[start:stop]
+        if categories is not None:
+            # Decoded back to the values, not a categorical, so the groups
+            # come out with the same index type as grouping the census data.
+            values = categories.take(values, allow_fill=True, fill_value=np.nan)
+        columns[col] = values
+    return CensusPartials.from_frame(pd.DataFrame(columns, columns=list(column_specs)))
+
+
+def get_process_context():
+    """
+    The multiprocessing context to start worker processes with: the fork
+    server where there is one, otherwise spawn.
+    :return: a multiprocessing context
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def compute_partials_parallel(census_data, processes=None, category_codes=None):
+    """
+    Compute the CensusPartials of the census data with a pool of processes,
+    one partition of rows each, and merge them.
+
+    This can run in a threaded server worker, and forking a process with
+    threads isn't safe, so the pool's processes are started by a fork
+    server, or spawned where there isn't one, rather than forked from here.
+    :param census_data: a dataframe with fixed names and the married column.
+    :param processes: how many processes to use. Defaults to the number of cores.
+    :param category_codes: an optional callable returning precomputed codes
+     of a column. See write_memmap_columns
+    :return: a CensusPartials obj
+    """
+    processes = processes or os.cpu_count() or 1
+    columns = list(census_data.select_dtypes(include=[np.number]).columns)
+    columns += [col for col in CensusPartials.GROUP_COLUMNS + [COUNTRY] if col not in columns]
+    bounds = [int(bound) for bound in np.linspace(0, len(census_data), processes + 1)]
+
+    directory = tempfile.mkdtemp(prefix='rti_partials_')
+    try:
+        specs = write_memmap_columns(census_data, columns, directory, category_codes)
+        partials = CensusPartials()
+        # Not ProcessPoolExecutor, which only takes a start method from Python 3.7.
+        with get_process_context().Pool(processes) as pool:
+            for partition in pool.starmap(compute_partition_partials,
+                                          zip(it.repeat(specs), bounds[:-1], bounds[1:])):
+                partials = partials.merge(partition)
+    finally:
+        shutil.rmtree(directory)
+    return partials
@@ -0,0 +1,226 @@
+"""
+Author: Scott Dillon
+Email: scott.dillon@gmail.com
+
+The plotly graph objects and helpers for the plots on the index page.
+These are kept apart from exercise_libs.py because importing plotly is
+slow. Import this module where a plot is made, not at the top of a module,
+so loading the app and the data doesn't pay for it.
+"""
+import plotly.graph_objs as go
+import plotly.offline
+
+from .exercise_libs import Colors, AGE, HOURS_PER_WEEK
+
+
+class GenericScatterTrace(go.Scatter):
+    """
+    This is a generic scatter trace inheriting from go.Scatter. Any common attributes 
+    could be assigned here if they'll be set for all scatter traces.
+    
+    Unfortunately, we can't use property decorator since plotly won't let us add
+    new attributes to graph_obj (go.*) objects. It checks this in the 
+    PlotlyDict.__setitem__ method. It would be nice to set up a function 
+    to check if x is a dataframe and just take the index or the values for x and y respec.
+    
+    I _could_ override the __setitem__ method but that _could_ also break the crap out
+    of the Scatter obj/plotly so let's don't and say we didn't.
+    """
+    def __init__(self, x=None, y=None, marker_size=5):
+        super().__init__(x=x, y=y)
+        self.x = x
+        self.y = y
+        self.marker.size = marker_size
+
+
+class HoursWorkedQuantileTrace(GenericScatterTrace):
+    """
+    Handles and sets standard attributes for the hours worked trace of all the hours
+    worked records. This would be more useful if it were'nt a one off and we 
+    were doing lots of scatter traces. Then we could set standard attributes of the
+    trace for lots of plots.
+    """
+    opacity_dict = {'0.1' : 0.3,
+                    '0.25': 0.7,
+                    '0.5' : 1.0,
+                    '0.75': 0.7,
+                    '0.9' : 0.3}
+
+    def __init__(self, x=None, y=None, quantile=None):
+        super().__init__(x=x, y=y)
+        self.mode = 'lines+markers'
+        self.marker.color = Colors.BLUE
+        self.marker.opacity = self.opacity_dict[str(quantile)]
+        self.opacity = self.opacity_dict[str(quantile)]
+        self.name = '{} Quantile'.format(quantile)
+
+
+class AvgHoursWorkedTrace(GenericScatterTrace):
+    """
+    Contains attributes specific to the mean hours worked trace on the hours worked plot.
+    Set this to use lines and markers.
+    """
+    def __init__(self, x=None, y=None, marker_size=8):
+        super().__init__(x=x, y=y)
+        self.mode = 'lines+markers'
+        self.marker.color = Colors.RED
+        self.marker.size = marker_size
+        self.name = 'Mean hours worked<br>at each age'
+
+
+class HoursWorkedLayout(go.Layout):
+    """
+    The plotly template object of the hours worked plot.
+    
+    Inherits from plotly.graph_objs.Layout object.
+    """
+    def __init__(self, height=600):
+        super().__init__()
+        self.title = "<b>Hours Per Week Worked by Age</b><br><i>with average hours worked by age</i>"
+        self.yaxis.title = HOURS_PER_WEEK
+        self.xaxis.title = AGE
+        self.height = height
+
+
+class PlotlyFigure(go.Figure):
+    """
+    the hours worked scatter figure with go.Data object
+    conversion and sets the layout.
+    """
+    def __init__(self, data=None, layout=None):
+        super().__init__()
+        self.data = go.Data(data)
+        self.layout = layout
+
+
+class HistogramHoursWorked(go.Histogram):
+    """
+    Histogram object to use. The bin sizing requires both
+    the autobinx to be false and the dict set for xins.
+
+    We use the colors class attribute to give both
+    attributes different colors without having to set them
+    manually. We're also using norm to set this to a probability
+    histogram intead of a count.
+    """
+    colors = Colors()
+
+    def __init__(self, name=None, x=None, y=None, opacity=0.5,
+                 line_width=1, norm='probability'):
+        super().__init__()
+        self.x = x
+        if y is not None:
+            # x holds each distinct value and y how many times it occurs.
+            self.y = y
+            self.histfunc = 'sum'
+        self.opacity = opacity
+        self.histnorm = norm
+        self.autobinx = False
+        self.xbins = {'start': 0, 'end': 100, 'size': 3}
+        self.name = name
+        self.marker.line.width = line_width
+        self.marker.color = self.colors.next_color()
+
+
+class HistogramLayout(go.Layout):
+    """
+    Subclass the layout for the histogram with default titles.
+    barmode is 'overlay' so that the two histograms will be overlaid and
+    not side by side.
+    """
+    def __init__(self, height=600):
+        super().__init__()
+        self.barmode = 'overlay'
+        self.title = "<b>Probability Histogram of Hours Worked Per Week for<br>People with Incomes over and under 50k</b>"
+        self.xaxis.title = 'Hours Worked per Week'
+        self.yaxis.title = 'Probability of Working X Hours Per Week'
+        self.height = height
+
+
+class ChoroplethOrigins(go.Choropleth):
+    """
+    subclass the choropleth graph obj to assign
+    attrs automatically. Important attrs here are
+    locationmode, locations, z and text
+    """
+    def __init__(self, z=None):
+        super().__init__()
+        self.locations = z.index
+        self.locationmode = 'country names'
+        self.z = z
+        self.text = z.index
+        self.marker.line.color = Colors.LIGHT_GRAY
+
+
+class ChoroLayout(go.Layout):
+    """
+    A layout for the choropleth plot with project defaults.
+    """
+    def __init__(self, height=500):
+        super().__init__()
+        self.height = height
+        self.geo.showframe = True
+        self.geo.showcoastlines = True
+        self.geo.projection.type = 'Mercator'
+        self.title = "<b>Home Country of Respondents Who Make<br>More Than $50K</b>"
+
+
+def get_plotly_div_str(figure_obj, image_height=800):
+    """
+    Gets the html for the div created by the plotly plot.
+    :param figure_obj: a plotly graph_objs Figure object with data and layout objects
+    :param image_height: an integer for the image height
+    :return: returns a string of html wrapped in a div element.
+    """
+    return plotly.offline.plot(figure_obj,
+                               include_plotlyjs=False,
+                               output_type='div',
+                               show_link=False,
+                               image_height=image_height)
+
+
+def make_quantile_traces(quantile_list, quantiles_gb):
+    """
+    Calculate and return quantiles.
+    The quantiles are in the top level of the hiearchical index.
+
+    :param quantile_list: A list of decimal values which are the quantiles
+        values  we want ot calculate.
+    :param quantiles_gb: the dataframe groupby object we'll locate the
+        quantiles values in.
+    :return:
+    """
+    q_traces = []
+    for q in quantile_list:
+        x = quantiles_gb.loc[q].index.values
+        y = quantiles_gb.loc[q].values
+        trace = HoursWorkedQuantileTrace(x=x, y=y, quantile=q)
+        q_traces.append(trace)
+    return q_traces
+
+
+def get_histo_hours_worked_traces(over_50k_df, under_50k_df):
+    """
+    Gets histogram objects from passed dataframes.
+    :param over_50k_df: a pandas dataframe.
+    :param under_50k_df: a pandas dataframe.
+    :return:
+    """
+    over_50k_histo = HistogramHoursWorked(x=over_50k_df, name='Over $50K')
+    under_50k_histo = HistogramHoursWorked(x=under_50k_df, name='Under $50K')
+    return [over_50k_histo, under_50k_histo]
+
+
+def get_histo_hours_worked_count_traces(over_50k_counts, under_50k_counts):
+    """
+    Gets histogram objects from counts of each hours worked value. The
+    histograms come out the same as passing every record's hours.
+    :param over_50k_counts: a series of counts indexed by hours worked.
+    :param under_50k_counts: a series of counts indexed by hours worked.
+    :return:
+    """
+    over_50k_histo = HistogramHoursWorked(x=over_50k_counts.index.values, y=over_50k_counts.values,
+                                          name='Over $50K')
+    under_50k_histo = HistogramHoursWorked(x=under_50k_counts.index.values, y=under_50k_counts.values,
+                                           name='Under $50K')
+    return [over_50k_histo, under_50k_histo]
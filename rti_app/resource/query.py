@@ -0,0 +1,277 @@
+"""
+Author: Scott Dillon
+Email: scott.dillon@gmail.com
+
+Group by queries of the census data. Queries are put in a canonical form
+and checked here, and computed from group stats that can be merged across
+chunks or partitions of the data. The caches for query results and other
+values built once per version of the data are here too.
+"""
+import threading
+import collections
+import numpy as np
+import pandas as pd
+
+
+class LRUCache(object):
+    """
+    A thread safe, size bounded cache that throws away the least
+    recently used item when it's full.
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value for the key or compute, cache and return it.
+        The lock isn't held while computing so a slow computation doesn't
+        hold up other lookups.
+        :param key: a hashable key
+        :param compute: a callable with no arguments returning the value
+        :return: the value
+        """
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        value = compute()
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        """
+        Empty the cache.
+        :return: None
+        """
+        with self._lock:
+            self._items.clear()
+
+
+class VersionedValue(object):
+    """
+    A value built from the census data the first time it's needed after
+    the data changes, i.e. a cube or partial aggregates. Threads asking for
+    it at the same time wait for one build rather than each doing it.
+    """
+    def __init__(self):
+        # The version and the value are swapped in together so a reader
+        # never sees one without the other.
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def get(self, version, build):
+        """
+        Return the value for the version, building it if it's out of date.
+        :param version: the data version the value has to be for
+        :param build: a callable with no arguments returning the value
+        :return: the value
+        """
+        entry = self._entry
+        if entry is None or entry[0] != version:
+            with self._lock:
+                entry = self._entry
+                if entry is None or entry[0] != version:
+                    entry = (version, build())
+                    self._entry = entry
+        return entry[1]
+
+
+def fix_column_name(column):
+    """
+    Turn a database column name into a census data column name by
+    swapping underscores for spaces and using title case.
+    i.e. 'over_50k' becomes 'Over 50K'
+    :param column: a column name string
+    :return: a string
+    """
+    return column.replace('_', ' ').title()
+
+
+def coerce_filter_values(dtype, values):
+    """
+    Convert filter value strings from a query string to the dtype of the
+    column they will be compared against.
+    :param dtype: the dtype of a census data column
+    :param values: a list of strings
+    :return: a list of values of the column's type
+    :raises ValueError: if a value can't be converted.
+    """
+    if pd.api.types.is_bool_dtype(dtype):
+        return [value.lower() in ('1', 'true', 'yes') for value in values]
+    if pd.api.types.is_numeric_dtype(dtype):
+        return [float(value) for value in values]
+    return list(values)
+
+
+"""
+The aggregation functions query_aggregate accepts.
+"""
+QUERY_FUNCTIONS = frozenset(['count', 'sum', 'mean', 'std', 'var', 'min', 'max', 'median'])
+
+
+def normalize_query(groupby_cols, agg_dict):
+    """
+    Put a group by query in a canonical, hashable form so queries asking
+    for the same thing share a cache entry.
+    :param groupby_cols: a list of column names to group by
+    :param agg_dict: a dict of column names to a function name or list of them.
+    :return: a tuple of the group by column names and a sorted tuple of
+     (column name, sorted tuple of function names) pairs.
+    :raises ValueError: for an empty group by or unknown function.
+    """
+    groupby_cols = tuple(fix_column_name(col) for col in groupby_cols)
+    if not groupby_cols or not agg_dict:
+        raise ValueError('A query needs group by columns and aggregations')
+    aggregations = []
+    for col, funcs in agg_dict.items():
+        funcs = [funcs] if isinstance(funcs, str) else funcs
+        unknown = set(funcs) - QUERY_FUNCTIONS
+        if unknown:
+            raise ValueError('Unknown aggregation functions {}'.format(sorted(unknown)))
+        aggregations.append((fix_column_name(col), tuple(sorted(set(funcs)))))
+    return groupby_cols, tuple(sorted(aggregations))
+
+
+def normalize_filters(dtypes, filters):
+    """
+    Check filters from a query string and put them in a canonical, hashable
+    form with the values converted to the dtypes of their columns.
+    :param dtypes: a series of the census data column dtypes
+    :param filters: a dict of column names to lists of string values, or None
+    :return: a sorted tuple of (column name, sorted tuple of values) pairs.
+    :raises KeyError: if a filter names a column we don't have.
+    :raises ValueError: if a value can't be converted to the column's dtype.
+    """
+    where = []
+    for column, values in (filters or {}).items():
+        column = fix_column_name(column)
+        if column not in dtypes.index:
+            raise KeyError('Unknown filter column {!r}'.format(column))
+        where.append((column, tuple(sorted(set(coerce_filter_values(dtypes[column], values))))))
+    return tuple(sorted(where))
+
+
+def check_query_columns(dtypes, groupby_cols, aggregations):
+    """
+    Check a normalized query's columns exist and that text columns are
+    only counted.
+    :param dtypes: a series of the census data column dtypes
+    :param groupby_cols: a tuple of column names
+    :param aggregations: a tuple of (column, tuple of functions) pairs
+    :return: None
+    :raises KeyError: if a column isn't in the census data.
+    :raises ValueError: for a function other than count of a text column.
+    """
+    for col in list(groupby_cols) + [col for col, _ in aggregations]:
+        if col not in dtypes.index:
+            raise KeyError('Unknown column {!r}'.format(col))
+    for col, funcs in aggregations:
+        dtype = dtypes[col]
+        numeric = pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype)
+        if not numeric and set(funcs) != {'count'}:
+            raise ValueError('Only count can be computed of the text column {!r}'.format(col))
+
+
+def query_result_columns(agg_dict):
+    """
+    The (column, function) pairs of a query's result in the order
+    the agg_dict asked for them.
+    :param agg_dict: a dict of column names to a function name or list of them.
+    :return: a list of tuples
+    """
+    return [(fix_column_name(col), func) for col, funcs in agg_dict.items()
+            for func in ([funcs] if isinstance(funcs, str) else funcs)]
+
+
+def group_stats(census_data, groupby_cols, value_cols):
+    """
+    The count, sum, sum of squares, min and max of each value column
+    for each group. These can be merged across slices of the data with
+    merge_group_stats and turned into means, variances etc. with
+    finish_group_stats. Text columns only get a count.
+    :param census_data: a dataframe
+    :param groupby_cols: a list of column names to group by
+    :param value_cols: a list of column names to compute stats of
+    :return: a dataframe indexed by group with (column, stat) columns.
+    """
+    keys = [census_data[col] for col in groupby_cols]
+    stats = {}
+    for col in value_cols:
+        values = census_data[col]
+        if not (pd.api.types.is_bool_dtype(values) or pd.api.types.is_numeric_dtype(values)):
+            stats[(col, 'count')] = values.groupby(keys).count()
+            continue
+        values = values.astype(float)
+        groupby = values.groupby(keys)
+        stats[(col, 'count')] = groupby.count()
+        stats[(col, 'sum')] = groupby.sum()
+        stats[(col, 'sumsq')] = (values ** 2).groupby(keys).sum()
+        stats[(col, 'min')] = groupby.min()
+        stats[(col, 'max')] = groupby.max()
+    return pd.DataFrame(stats)
+
+
+def merge_group_stats(stats, other_stats):
+    """
+    Combine two frames of group stats from group_stats.
+    :param stats: a dataframe or None
+    :param other_stats: a dataframe
+    :return: a dataframe
+    """
+    if stats is None:
+        return other_stats
+    combined = pd.concat([stats, other_stats])
+    groupby = combined.groupby(level=list(range(combined.index.nlevels)))
+    merged = []
+    for stat, merge_func in (('min', 'min'), ('max', 'max')):
+        merged.append(getattr(groupby[[key for key in combined.columns if key[1] == stat]], merge_func)())
+    merged.append(groupby[[key for key in combined.columns if key[1] not in ('min', 'max')]].sum())
+    return pd.concat(merged, axis=1)[combined.columns]
+
+
+def finish_group_stats(stats, aggregations, dtypes=None):
+    """
+    Turn group stats into the aggregations a query asked for.
+    :param stats: a dataframe from group_stats or merge_group_stats
+    :param aggregations: a tuple of (column, tuple of functions) pairs
+    :param dtypes: an optional series or dict of the source column dtypes.
+     The stats are floats, so min and max are cast back to these, and sums
+     of integer or boolean columns to integers, to match grouping the
+     source data.
+    :return: a dataframe with a (column, function) column per aggregation.
+    :raises ValueError: for a function we can't compute from the stats.
+    """
+    results = collections.OrderedDict()
+    for col, funcs in aggregations:
+        count = stats[(col, 'count')]
+        for func in funcs:
+            if func == 'count':
+                results[(col, func)] = count.astype(int)
+            elif func in ('min', 'max') and (col, func) in stats:
+                results[(col, func)] = stats[(col, func)]
+                if dtypes is not None and col in dtypes:
+                    results[(col, func)] = results[(col, func)].astype(dtypes[col])
+            elif func == 'sum' and (col, func) in stats:
+                results[(col, func)] = stats[(col, func)]
+                if dtypes is not None and col in dtypes and \
+                        (pd.api.types.is_integer_dtype(dtypes[col]) or pd.api.types.is_bool_dtype(dtypes[col])):
+                    results[(col, func)] = results[(col, func)].astype(np.int64)
+            elif func == 'mean' and (col, 'sum') in stats:
+                results[(col, func)] = stats[(col, 'sum')] / count
+            elif func in ('var', 'std') and (col, 'sumsq') in stats:
+                variance = (stats[(col, 'sumsq')] - stats[(col, 'sum')] ** 2 / count) / (count - 1)
+                results[(col, func)] = variance if func == 'var' else np.sqrt(variance)
+            else:
+                raise ValueError('Cannot compute {} of {} from group stats'.format(func, col))
+    result = pd.DataFrame(results, index=stats.index)
+    result.columns = pd.MultiIndex.from_tuples(list(results))
+    return result
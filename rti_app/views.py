@@ -34,25 +34,23 @@ def show_data(page=1):
     on here so lets go through them.
 
     First, set the records to show for each page.
-    Then, chop the large dataframe up if it isn't already.
     Get the page number from the query string.
-    Make sure the page number is within the bounds of our page number
-        which are also the indices of the data_processor.list_pages
-        which is our list of smaller size databases.
+    Make sure the page number is within the bounds of our page numbers.
+    The data processor chops up the large dataframe the first time
+        it's asked for the number of pages.
     :return: render the template with our templated stuff in it.
     """
-    page_length = 25
-
-    core.chop_dataframe(core.data_processor, page_length)
+    page_length = my_app.config['RECORDS_PER_PAGE']
+    data_processor = core.get_data_processor()
 
     if flask.request.args.get('page'):
         page = int(flask.request.args.get('page'))
 
     first_page = 1
-    last_page = len(core.data_processor.list_pages)
+    last_page = data_processor.page_count(page_length)
     page = sorted([first_page, page, last_page])[1]
 
-    table_html = core.data_processor.list_pages[page - 1]
+    table_html = data_processor.get_page(page, page_length)
     table_html = el.change_table_css_class(table_html, index=True)
     return flask.render_template('show_data.html',
                            title="RTI Exercise, Scott Dillon",
@@ -60,3 +58,68 @@ def show_data(page=1):
                            page=page,
                            first_page=first_page,
                            last_page=last_page)
+
+
+@my_app.route('/export', methods=['GET'])
+def export():
+    """
+    Streams the census records as a download. The query string takes
+    the same page parameter as the data view plus any number of column
+    filters, i.e.
+
+        /export?format=ndjson&race=White&over_50k=1&page=3
+
+    A filter can be repeated to match any of several values. format is
+    one of csv (the default), ndjson or arrow. A page that isn't a
+    number is a bad request rather than an export of every page.
+
+    The records are read and written a chunk at a time so the server
+    never builds the whole export in memory and a slow client only
+    holds up its own generator.
+    :return: a streaming response
+    """
+    args = flask.request.args
+    export_format = args.get('format', 'csv')
+    page = args.get('page', type=int)
+    if page is None and 'page' in args:
+        flask.abort(400)
+    filters = {key: args.getlist(key) for key in args if key not in ('format', 'page')}
+
+    try:
+        content, mimetype, file_name = core.export_records(filters,
+                                                           export_format,
+                                                           my_app.config['EXPORT_CHUNK_SIZE'],
+                                                           page=page,
+                                                           page_length=my_app.config['RECORDS_PER_PAGE'])
+    except (KeyError, ValueError):
+        flask.abort(400)
+    except ImportError:
+        flask.abort(501)
+
+    response = flask.Response(content, mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename={}'.format(file_name)
+    return response
+
+
+@my_app.route('/api/aggregate', methods=['GET'])
+def api_aggregate():
+    """
+    Groups the census data and returns the aggregated groups as json.
+    by names a column to group by and agg a column and the functions
+    to aggregate it with. Both can be repeated, i.e.
+
+        /api/aggregate?by=Race&by=Sex&agg=Age:mean,max&agg=Hours Per Week:mean
+
+    The functions are count, sum, mean, std, var, min, max and median.
+    Any other parameters filter the records the same as the export, i.e.
+    &over_50k=1. Results are cached so repeating a query is cheap.
+    :return: a json response
+    """
+    args = flask.request.args
+    filters = {key: args.getlist(key) for key in args if key not in ('by', 'agg')}
+    try:
+        agg_dict = core.parse_aggregations(args.getlist('agg'))
+        content = core.aggregate_json(args.getlist('by'), agg_dict, filters=filters)
+    except (KeyError, ValueError):
+        flask.abort(400)
+    return flask.Response(content, mimetype='application/json')
@@ -1,2 +1,6 @@
 from rti_app import my_app
-my_app.run(debug=True)
+
+# The guard keeps processes started by the fork server or spawn, which
+# import this module, from running a server of their own.
+if __name__ == '__main__':
+    my_app.run(debug=True)
@@ -0,0 +1,143 @@
+"""
+Check that every data processor gives the same dashboard numbers and query
+results as computing them with pandas straight from the whole census data.
+The cube, chunked and partitioned processors get them from merged or
+precomputed aggregates, so these guard those aggregates against drifting.
+"""
+import pandas as pd
+import pytest
+
+from rti_app import config
+from rti_app.resource import exercise_libs as el
+
+CHUNK_SIZE = 7000
+PAGE_LENGTH = 25
+
+
+@pytest.fixture(scope='module')
+def csv_file(tmp_path_factory):
+    csv_file = str(tmp_path_factory.mktemp('census') / 'exercise_records.csv')
+    el.write_csv_file(sqlite_file=el.get_full_path('exercise01.sqlite'),
+                      query_file=el.get_full_path('records_flatten.sql'),
+                      csv_file=csv_file)
+    return csv_file
+
+
+@pytest.fixture(scope='module')
+def census_data(csv_file):
+    data_proc = el.DataProcessor(pd.read_csv(csv_file))
+    data_proc.create_married_column()
+    return data_proc.census_data
+
+
+def make_cube_processor(csv_file):
+    data_proc = el.DataProcessor(pd.read_csv(csv_file), cube_dimensions=config.CUBE_DIMENSIONS)
+    data_proc.create_married_column()
+    return data_proc
+
+
+def make_partitioned_processor(csv_file):
+    data_proc = el.PartitionedDataProcessor(pd.read_csv(csv_file), processes=2,
+                                            cube_dimensions=config.CUBE_DIMENSIONS)
+    data_proc.create_married_column()
+    return data_proc
+
+
+def make_chunked_csv_processor(csv_file):
+    return el.ChunkedDataProcessor.from_csv(csv_file, CHUNK_SIZE)
+
+
+def make_chunked_sql_processor(csv_file):
+    return el.ChunkedDataProcessor.from_sql(el.get_full_path('exercise01.sqlite'),
+                                            el.get_full_path('records_flatten.sql'), CHUNK_SIZE)
+
+
+PROCESSORS = {'cube': make_cube_processor,
+              'partitioned': make_partitioned_processor,
+              'chunked_csv': make_chunked_csv_processor,
+              'chunked_sql': make_chunked_sql_processor}
+PARTIALS_PROCESSORS = ['partitioned', 'chunked_csv', 'chunked_sql']
+CHUNKED_PROCESSORS = ['chunked_csv', 'chunked_sql']
+
+
+@pytest.fixture(scope='module', params=sorted(PROCESSORS))
+def processor(request, csv_file):
+    return PROCESSORS[request.param](csv_file)
+
+
+@pytest.fixture(scope='module', params=PARTIALS_PROCESSORS)
+def partials_processor(request, csv_file):
+    return PROCESSORS[request.param](csv_file)
+
+
+@pytest.fixture(scope='module', params=CHUNKED_PROCESSORS)
+def chunked_processor(request, csv_file):
+    return PROCESSORS[request.param](csv_file)
+
+
+def test_describe(processor, census_data):
+    expected = el.round_decimals(census_data.describe(), 3)
+    pd.testing.assert_frame_equal(processor.describe_census_data(), expected)
+
+
+def test_over_50k_married_race(processor, census_data):
+    agg_dict = {'Married': ['count'],
+                'Age': ['mean'],
+                'Hours Per Week': ['mean'],
+                'Education Num': ['mean']}
+    expected = el.round_decimals(census_data.groupby(['Over 50K', 'Married', 'Race']).agg(agg_dict), 2)
+    pd.testing.assert_frame_equal(processor.aggregate_50k_married_race(agg_dict), expected)
+
+
+def test_over_50k_country_counts(processor, census_data):
+    over_50k = census_data[census_data['Over 50K'] == 1]
+    over_50k = over_50k[~over_50k['Country'].isin(['United-States', '?'])]
+    expected = over_50k.groupby('Country')['Country'].count()
+    pd.testing.assert_series_equal(processor.get_country_data(), expected,
+                                   check_names=False, check_dtype=False)
+
+
+def test_hours_by_age(partials_processor, census_data):
+    quantiles = [0.1, 0.25, 0.5, 0.75, 0.9]
+    by_age = census_data.groupby('Age')['Hours Per Week']
+    expected_quantiles = by_age.quantile(quantiles).reorder_levels([1, 0])
+    partials = partials_processor.partials
+    pd.testing.assert_series_equal(partials.hours_quantiles_by_age(quantiles).sort_index(),
+                                   expected_quantiles.sort_index(),
+                                   check_names=False, check_dtype=False, check_index_type=False)
+    pd.testing.assert_series_equal(partials.mean_hours_by_age(), by_age.mean(),
+                                   check_names=False, check_index_type=False)
+
+
+@pytest.mark.parametrize('groupby_cols, agg_dict, filters', [
+    (['Race'], {'Age': ['mean', 'std', 'min', 'max', 'sum', 'count']}, None),
+    (['Sex', 'Over 50K'], {'Income': ['sum', 'var'], 'Hours Per Week': ['mean']}, None),
+    (['Race'], {'Age': ['mean', 'max'], 'Loss': ['sum']}, {'sex': ['Female'], 'over_50k': ['1']}),
+    (['Country'], {'Age': ['sum'], 'Sex': ['count']}, None),
+    (['Education Level'], {'Age': ['min']}, {'country': ['Mexico', 'Canada']}),
+    (['Race'], {'Age': ['mean']}, {'sex': ['Nobody']}),
+])
+def test_query_aggregate(processor, census_data, groupby_cols, agg_dict, filters):
+    records = census_data
+    for column, values in (filters or {}).items():
+        column = el.fix_column_name(column)
+        records = records[records[column].isin(el.coerce_filter_values(records[column].dtype, values))]
+    expected = el.round_decimals(records.groupby(groupby_cols).agg(agg_dict), 2)
+    result = processor.query_aggregate(groupby_cols, agg_dict, filters=filters)
+    pd.testing.assert_frame_equal(result, expected, check_index_type=len(expected) > 0)
+
+
+@pytest.mark.parametrize('rows', [range(0, 25), range(6990, 7010), range(13999, 14001),
+                                  range(48825, 48850), range(48842, 48867)])
+def test_iter_rows(chunked_processor, census_data, rows):
+    expected = census_data.iloc[rows.start:rows.stop]
+    result = pd.concat(list(chunked_processor.iter_rows(rows)))
+    assert list(result.index) == list(range(rows.start, rows.start + len(expected)))
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_page_rows(processor):
+    last_page = processor.page_count(PAGE_LENGTH)
+    for page in (1, 2, last_page):
+        rows = processor.page_rows(page, PAGE_LENGTH)
+        assert len(processor.get_page(page, PAGE_LENGTH)) == len(rows)
@@ -0,0 +1,27 @@
+"""
+Production entry point for the app. Serve it with the preforking
+gunicorn server using the settings in gunicorn_config.py:
+
+    gunicorn -c gunicorn_config.py wsgi:application
+
+With preload_app on, this module is imported once in the gunicorn master
+before any workers are forked. Importing the app doesn't load any data,
+so core.warm_up loads and paginates the census data (and computes any
+partial aggregates and the data cube) here. Each worker then shares
+those pages with the master copy-on-write instead of building its
+own copy on its first request.
+"""
+import gc
+import os
+
+os.environ.setdefault('RTI_ENV', 'production')
+
+from rti_app import my_app as application
+import rti_app.core as core
+
+core.warm_up(application.config['RECORDS_PER_PAGE'])
+
+# Move everything loaded so far out of the garbage collector's reach so
+# collections in the workers don't touch (and so copy) the shared pages.
+if hasattr(gc, 'freeze'):
+    gc.freeze()